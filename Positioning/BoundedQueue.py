@@ -0,0 +1,120 @@
+"""
+    This module contains the BoundedQueue class, a Queue with a maximum size
+    and a policy deciding what happens when an item is offered to it while
+    it is full.  It is used between the stages of the pipeline (the data
+    sources, the observation managers and the dump writers) so a slow
+    consumer can not make memory grow without limit.
+
+    The policies are:
+        block                 The producer waits until there is room, as
+                              with a bounded Queue.
+
+        drop-oldest           The oldest item in the queue is dropped to
+                              make room.
+
+        coalesce              If the newest queued item is an observation
+                              of the same receiver and gain level, the item
+                              is combined with it into a CountDelta record
+                              (see the Positioning.Identifiers module), so
+                              no observation is lost, only its exact time.
+                              Otherwise the oldest item is dropped.  Only
+                              consecutive items are combined so the queue
+                              stays in time order.
+
+    Dropped and coalesced items are counted by the queue and, if it is
+    named, by the queue_dropped_total and queue_coalesced_total metrics.
+"""
+from __future__ import with_statement
+from Positioning import Metrics, Identifiers
+from Queue import Queue
+
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+COALESCE = "coalesce"
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+class BoundedQueue(Queue):
+    """
+        The BoundedQueue class is a Queue which holds at most 'maxsize'
+        items and applies its policy to any item offered while it is full.
+    """
+    def __init__(self,maxsize=10000,policy=BLOCK,name=None):
+        """
+            Constructs a BoundedQueue of at most 'maxsize' items, which must
+            be at least one, with one of the policies of the POLICIES tuple.
+            If a name is given the depth of the queue and the number of
+            dropped and coalesced items are published as metrics labelled
+            with it.
+        """
+        if maxsize < 1:
+            raise Exception("A bounded queue must hold at least one item")
+        if policy not in POLICIES:
+            raise Exception("Unknown queue policy: %s" % policy)
+
+        Queue.__init__(self,maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+
+        self.droppedCounter = None
+        self.coalescedCounter = None
+        if name is not None:
+            labels = {"queue":name}
+            self.droppedCounter = Metrics.counter("queue_dropped_total", "Items dropped from a full queue", labels)
+            self.coalescedCounter = Metrics.counter("queue_coalesced_total", "Items coalesced in a full queue", labels)
+            Metrics.gauge("queue_depth", "Items waiting in a queue", labels, function=self.qsize)
+
+    def put(self,item,block=True,timeout=None):
+        """
+            Puts 'item' into the queue.  Only the block policy ever waits for
+            room, and only if 'block' is set.
+        """
+        if self.policy == BLOCK:
+            return Queue.put(self,item,block,timeout)
+
+        with self.not_full:
+            if self._qsize() >= self.maxsize:
+                if self.policy == COALESCE and self.merge(item):
+                    return
+                self.drop()
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def merge(self,item):
+        """
+            Combines 'item' with the newest queued item if it is an
+            observation of the same receiver and gain level, returning False
+            if it is not.  The caller must hold the queue's mutex.
+        """
+        recv = getattr(item,"recv",None)
+        if recv is None or not self.queue:
+            return False
+
+        # Merging into an older item would move its time ahead of the items
+        # queued after it, so only the newest is considered
+        other = self.queue[-1]
+        if getattr(other,"recv",None) != recv or other.gain != item.gain:
+            return False
+
+        self.queue[-1] = Identifiers.coalesce(other,item)
+        self.coalesced += 1
+        if Metrics.enabled and self.coalescedCounter is not None:
+            self.coalescedCounter.inc()
+        return True
+
+    def drop(self):
+        """
+            Drops the oldest item in the queue.  The caller must hold the
+            queue's mutex.
+        """
+        self._get()
+        self.dropped += 1
+        if Metrics.enabled and self.droppedCounter is not None:
+            self.droppedCounter.inc()
+
+        # The dropped item will never be marked as done by a consumer
+        self.unfinished_tasks -= 1
+        if self.unfinished_tasks == 0:
+            self.all_tasks_done.notify_all()
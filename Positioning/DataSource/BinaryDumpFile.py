@@ -0,0 +1,105 @@
+"""
+    This module contains a DataSource implementation to handle parsing data
+    from a binary Observation Dump File, and the PackObservation function
+    used to write its records.  It holds the same observations as the comma
+    separated Observation Dump File (see the Positioning.DataSource.DumpFile
+    module) in less space, and can be read without parsing text.
+
+    The file starts with the MAGIC string, followed by one record for each
+    observation, all numbers little endian:
+        Data Timestamp      : double (Epoch Timestamp)
+        Receiver IP Address : 4 bytes, an IPv4 address
+        Gain Level          : unsigned byte
+        Tag Count           : unsigned short, the number of detected tags
+        Detected Tags       : 6 bytes for each detected tag, the raw tag ID
+                              as sent by the receiver
+
+    Receiver addresses must therefore be IPv4 addresses and tag IDs 12
+    hexadecimal digits.  Every record is a single sample, so the file can
+    not hold the CountDelta records of aggregated or coalesced
+    observations.  Observations are read as Observation records, see the
+    Positioning.Identifiers module.
+"""
+from Positioning.Identifiers import Observation
+from Positioning import Identifiers
+import threading, struct, socket, binascii
+
+MAGIC = "OBSDUMP1"
+
+# The fixed part of every record, the tag IDs follow it
+RECORD = struct.Struct("<d4sBH")
+TAG_SIZE = 6
+
+def IsBinaryDumpFile(filename):
+    """
+        Returns True if the file 'filename' starts with the MAGIC string.
+    """
+    input = open(filename, "rb")
+    try:
+        return input.read(len(MAGIC)) == MAGIC
+    finally:
+        input.close()
+
+def PackObservation(time,recv,gain,tagids):
+    """
+        Returns the record of an observation made at the time 'time' by the
+        receiver address 'recv' at the gain level 'gain', where tagids is a
+        string of the raw 6 byte IDs of the detected tags.
+    """
+    return RECORD.pack(time, socket.inet_aton(recv), gain, len(tagids) // TAG_SIZE) + tagids
+
+class BinaryDumpFileReader(threading.Thread):
+    """
+        This class handles parsing data from a single binary observation
+        dump file and putting that data onto a queue defined at
+        construction, in the same way as the DumpFileReader class.
+    """
+    def __init__(self,queue,filename):
+        """
+            Constructs a BinaryDumpFileReader instance which will open the
+            file defined by the 'filename' variable and when started will
+            offer data to the queue defined by the 'queue' variable.
+        """
+        self.queue = queue
+        self.file = open(filename, "rb")
+
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise Exception("Not a binary observation dump file: %s" % filename)
+
+        threading.Thread.__init__(self)
+
+    def run(self):
+        # The receiver addresses seen so far by their raw bytes and the names
+        # of the tag IDs, whose interned ids may be reused over time
+        receivers = dict()
+        tags = dict()
+
+        while True:
+            header = self.file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+
+            time,addr,gain,count = RECORD.unpack(header)
+            tagids = self.file.read(count * TAG_SIZE)
+
+            recv = receivers.get(addr)
+            if recv is None:
+                recv = receivers[addr] = Identifiers.receivers.intern(socket.inet_ntoa(addr))
+
+            mask = 0
+            for i in xrange(0, len(tagids), TAG_SIZE):
+                raw = tagids[i:i+TAG_SIZE]
+                name = tags.get(raw)
+                if name is None:
+                    name = tags[raw] = binascii.hexlify(raw)
+                mask |= 1 << Identifiers.tags.intern(name)
+
+            observation = Observation(recv, gain, mask, time)
+
+            # if the queue is iterable lets assume its a list of queues and
+            # write the observation to every one of them
+            if not hasattr(self.queue,'__iter__'):
+                self.queue.put(observation)
+            else:
+                for queue in self.queue:
+                    queue.put(observation)
@@ -2,13 +2,17 @@
     This module contains a function and class to manage parsing data
     from and writing data to a calibration file.
 """
-import re, time
+import re, time, os
 
-def ParseCalibrationFile(filename):
+def ParseCalibrationCounts(filename):
     """
-        Parses a calibration file and returns the calibration data as a
-        dictionary whose key is a tuple whose components are the receiver,
-        the power level, and the position.
+        Parses a calibration file and returns the raw counts as a dictionary
+        whose key is a tuple whose components are the receiver, the power
+        level, and the position.  The value is a list of the number of
+        detections, the number of samples and the sampling rate.  Lines
+        with the same key are summed, so a file written over several
+        sessions (or several files parsed one after another) combine
+        naturally.
     """
     CalibrationFile = open(filename, "r")
     CalibrationData = dict()
@@ -27,15 +31,120 @@ def ParseCalibrationFile(filename):
                 CalibrationData[key][0] += x
                 CalibrationData[key][1] += n
             else:
-                CalibrationData[key] = [x,n]
+                CalibrationData[key] = [x,n,t]
     finally:
         CalibrationFile.close()
-        
-    for key,(x,n) in CalibrationData.items():
+    
+    return CalibrationData
+
+def ParseCalibrationFile(filename):
+    """
+        Parses a calibration file and returns the calibration data as a
+        dictionary whose key is a tuple whose components are the receiver,
+        the power level, and the position.
+    """
+    CalibrationData = ParseCalibrationCounts(filename)
+    
+    for key,(x,n,t) in CalibrationData.items():
         CalibrationData[key] = x / n
 
     return CalibrationData
 
+def GainInformation(CalibrationData):
+    """
+        Measures how informative every (receiver, power level) pair of the
+        calibration data returned by ParseCalibrationFile is.  A power level
+        whose probability of detection is the same at every position can not
+        tell the positions apart, so the variance of the probability across
+        positions is used as the measure.
+        
+        Returns a dictionary whose key is a tuple of the receiver and the
+        power level and whose value is the variance.
+    """
+    probabilities = dict()
+    for (recv,g,p),prob in CalibrationData.items():
+        probabilities.setdefault((recv,g), []).append(prob)
+    
+    information = dict()
+    for key,values in probabilities.items():
+        mean = sum(values) / len(values)
+        information[key] = sum((x - mean)**2 for x in values) / len(values)
+    
+    return information
+
+class CalibrationIndex():
+    """
+        The CalibrationIndex class lists the (receiver, power level) cells of
+        the calibration data which can tell positions apart.  A cell whose
+        probability of detection is the same at every position adds the same
+        amount to the likelihood of every position, which cancels out when
+        the likelihoods are compared, so it does not need to be evaluated.
+    """
+    def __init__(self, CalibrationData, positions, receivers, threshold=0.0):
+        """
+            Constructs a CalibrationIndex for the given positions and
+            receivers from the calibration data returned by
+            ParseCalibrationFile.
+            
+            A cell is informative when the difference between its highest
+            and lowest probability across the positions is greater than
+            'threshold'.  The default of zero only drops cells which can not
+            change the result, higher values trade accuracy for speed.
+        """
+        self.threshold = threshold
+        self.cells = []
+        self.skipped = 0
+        
+        for recv in receivers:
+            for gain in range(32):
+                probs = dict((pos, CalibrationData[(recv,gain,pos)]) for pos in positions)
+                if max(probs.values()) - min(probs.values()) > threshold:
+                    self.cells.append( (recv,gain,probs) )
+                else:
+                    self.skipped += 1
+    
+    def __iter__(self):
+        """
+            Iterates over the informative cells as tuples of the receiver,
+            the power level and a dictionary mapping each position to its
+            probability of detection.
+        """
+        return iter(self.cells)
+    
+    def __len__(self):
+        return len(self.cells)
+
+def CompletedCells(filename, samples):
+    """
+        Returns the set of (receiver, power level, position) keys of a
+        calibration file which have already been measured with at least
+        'samples' samples.  Calibration scripts use this to resume an
+        interrupted session without measuring finished cells again.  If the
+        file does not exist yet no cells are complete.
+    """
+    if not os.path.exists(filename):
+        return set()
+    return set(key for key,(x,n,t) in ParseCalibrationCounts(filename).items() if n >= samples)
+
+def MergeCalibrationFiles(filenames, writer):
+    """
+        Merges the calibration files listed in 'filenames' by summing the
+        counts of every (receiver, power level, position) key and writes a
+        single line for each key using the CalibrationFileWriter 'writer'.
+    """
+    merged = dict()
+    for filename in filenames:
+        for key,(x,n,t) in ParseCalibrationCounts(filename).items():
+            if merged.has_key(key):
+                merged[key][0] += x
+                merged[key][1] += n
+            else:
+                merged[key] = [x,n,t]
+    
+    for (recv,g,p),(x,n,t) in sorted(merged.items()):
+        writer.writeCalibrationData(receiver=recv, rate=t, gain=g, position=p,
+                                    samples=n, detections=x)
+
 class CalibrationFileWriter():
     """
         This class handles writing calibration data to a file.
@@ -59,6 +168,7 @@ class CalibrationFileWriter():
     
     def writeCalibrationData(self,receiver,rate,gain,position,samples,detections):
         """
-            Writes a single line of calibration data to the file
+            Writes a single line of calibration data to the file, the columns
+            are in the order read by ParseCalibrationFile.
         """
-        self.__file.write("%s,%f,%d,%s,%d,%d\n" % (receiver,rate,gain,position,samples,detections))
+        self.__file.write("%s,%f,%d,%d,%d,%d\n" % (receiver,rate,gain,samples,position,detections))
@@ -12,7 +12,21 @@
         Receiver IP Address : String IP address (not validated)
         Gain Level          : integer
         Detected Tags List  : Semicolon (;) separated list        
+    
+    A line may instead hold the counts of a number of observations (a
+    CountDelta record) by adding a fifth column:
+        Samples             : integer, the number of observations
+    in which case each entry of the detected tags list is written as
+    TAG:COUNT, the tag ID and the number of observations it was detected
+    in.  The timestamp is that of the last of the observations.
+    
+    Observations are read as Observation and CountDelta records, see the
+    Positioning.Identifiers module.  A reader can be told to skip every
+    observation up to a time, such as the time of an observation manager's
+    checkpoint, in which case it finds the first observation after it with
+    a binary search of the file rather than parsing every line.
 """
+from Positioning.Identifiers import Observation, CountDelta
 import threading, re, time
 
 class DumpFileWriter(threading.Thread):
@@ -80,11 +94,24 @@ class DumpFileWriter(threading.Thread):
     def writeObservation(self, obs):
         """
             Writes a single observation line to the file.  Not thread safe.
+            
+            The observation may be an Observation record or a tuple of the
+            receiver address, gain, list of tag IDs and time.  A CountDelta
+            record is written as a single line with its counts.
         """
         # If the file is not open throw an exception
         if not self.__file:
             raise Exception("File not open")
         
+        if isinstance(obs, CountDelta):
+            recv, gain, counts, ctime, samples = obs.names()
+            tags = ";".join("%s:%d" % (tag, counts[tag]) for tag in sorted(counts))
+            self.__file.write("%f,%s,%d,%s,%d\n" % ( ctime, recv, gain, tags, samples ))
+            return
+        
+        if isinstance(obs, Observation):
+            obs = obs.names()
+        
         self.__file.write("%f,%s,%d,%s\n" % ( obs[3], obs[0], obs[1], ";".join(obs[2]) ))
         
     def open(self):
@@ -127,17 +154,68 @@ class DumpFileReader(threading.Thread):
         classes the DumpFile class extends the Thread class and must be started
         before data is retrieved.  The class is NOT thread safe.   
     """
-    def __init__(self,queue,filename):
+    def __init__(self,queue,filename,after=None):
         """
             Constructs a DumpFile instance which will open the file defined by
             the 'filename' variable and when started will offer data to the
             queue defined by the 'queue' variable.
+            
+            If the 'after' variable is given only observations made after
+            that time are offered.  The file must be in time order.
         """
         self.queue = queue
-        self.file = open(filename, "r")
+        self.file = open(filename, "rb")
+        self.after = after
+        
+        if after is not None:
+            self.seek(after)
         
         threading.Thread.__init__(self)
     
+    def timeAt(self,offset):
+        """
+            Returns the time and offset of the first observation line which
+            starts at or after the byte offset 'offset', or (None, None) if
+            there is none.
+        """
+        # Move to the start of the next line, unless already at one
+        if offset > 0:
+            self.file.seek(offset - 1)
+            self.file.readline()
+        else:
+            self.file.seek(0)
+        
+        while True:
+            start = self.file.tell()
+            line = self.file.readline()
+            if not line:
+                return None, None
+            if line.startswith("#") or not line.strip():
+                continue
+            return float(line.split(",",1)[0]), start
+    
+    def seek(self,after):
+        """
+            Moves the file to the first observation made after the time
+            'after', using a binary search over the byte offsets of the file.
+        """
+        self.file.seek(0,2)
+        low, high = 0, self.file.tell()
+        
+        while low < high:
+            middle = (low + high) // 2
+            time, start = self.timeAt(middle)
+            if time is None or time > after:
+                high = middle
+            else:
+                low = middle + 1
+        
+        time, start = self.timeAt(low)
+        if start is None:
+            self.file.seek(0,2)
+        else:
+            self.file.seek(start)
+    
     def run(self):
         # helper function to determine if a string split result is actually an empty list
         notags = lambda x : len(x) == 1 and len(x[0]) == 0
@@ -155,17 +233,28 @@ class DumpFileReader(threading.Thread):
                 continue
             
             # Split the line by commas (CSV file).  Then parse the individual columns.
-            cols = line.split(",")
+            cols = line.strip().split(",")
             time,recv,gain,tags = float(cols[0]), cols[1], int(cols[2]), cols[3].split(";")
             
+            # Skip observations up to the time given at construction
+            if self.after is not None and time <= self.after:
+                continue
+            
             # If no tags were associated with this reading, then assign an empty list
             if notags(tags):
                 tags = []
             
+            # A fifth column holds the number of observations of a CountDelta
+            if len(cols) > 4:
+                counts = dict((tag, int(count)) for tag,count in [entry.split(":") for entry in tags])
+                observation = CountDelta.fromNames(recv,gain,int(cols[4]),counts,time)
+            else:
+                observation = Observation.fromNames(recv,gain,tags,time)
+            
             # if the queue is iterable lets assume its a list of queues and
             # write the observation to every one of them
             if not hasattr(self.queue,'__iter__'):
-                self.queue.put((recv,gain,tags,time))
+                self.queue.put(observation)
             else:
                 for queue in self.queue:
-                    queue.put((recv,gain,tags,time))
+                    queue.put(observation)
@@ -0,0 +1,107 @@
+"""
+    This module contains a function and class to manage reading and writing
+    a likelihood record file.
+
+    A likelihood record file stores the result of every inference made
+    during a run so that it can be visualized later, without the cost of
+    drawing each frame while observations are arriving.  The file is binary
+    and little endian to keep it compact:
+        Header              : magic "RFLK", version (unsigned short) and
+                              the number of positions P (unsigned short)
+        Positions           : P position numbers (signed int)
+
+    Followed by any number of records:
+        Timestamp           : double (Epoch Timestamp)
+        Observation Count   : unsigned int
+        Position            : signed int, the most likely position or the
+                              tracked position when tracking, -1 if unknown
+        Estimate            : two floats, the continuous (x,y) estimate
+        Likelihood          : P floats, in the order of the positions header
+"""
+import struct, threading
+
+MAGIC   = "RFLK"
+VERSION = 1
+
+HEADER   = struct.Struct("<4sHH")
+RECORD   = struct.Struct("<dIiff")
+
+def ParseLikelihoodFile(filename):
+    """
+        Parses a likelihood record file and returns a list of records.  Each
+        record is a tuple of the timestamp, the observation count, the
+        most likely position (None if unknown), the (x,y) estimate and a
+        dictionary mapping each position to its likelihood.
+    """
+    LikelihoodFile = open(filename, "rb")
+    records = []
+    try:
+        magic, version, count = HEADER.unpack(LikelihoodFile.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise Exception("%s is not a likelihood record file" % filename)
+
+        positions = struct.unpack("<%di" % count, LikelihoodFile.read(4*count))
+        values = struct.Struct("<%df" % count)
+
+        while True:
+            data = LikelihoodFile.read(RECORD.size + values.size)
+            if len(data) < RECORD.size + values.size:
+                break
+
+            t,n,pos,x,y = RECORD.unpack_from(data)
+            likelihood  = dict(zip(positions, values.unpack_from(data, RECORD.size)))
+            if pos < 0:
+                pos = None
+
+            records.append( (t,n,pos,(x,y),likelihood) )
+    finally:
+        LikelihoodFile.close()
+
+    return records
+
+class LikelihoodFileWriter():
+    """
+        This class handles writing likelihood records to a file.  It is
+        thread safe.
+    """
+    def __init__(self,filename,positions):
+        """
+            Creates the file 'filename' and writes the header for the list of
+            position numbers 'positions'.  Every record written must contain
+            a likelihood for each of these positions.
+        """
+        self.positions = list(positions)
+        self.__values = struct.Struct("<%df" % len(self.positions))
+        self.__lock = threading.RLock()
+
+        self.__file = open(filename, "wb")
+        self.__file.write(HEADER.pack(MAGIC, VERSION, len(self.positions)))
+        self.__file.write(struct.pack("<%di" % len(self.positions), *self.positions))
+
+    def close(self):
+        self.__lock.acquire(True)
+        self.__file.close()
+        self.__lock.release()
+
+    def flush(self):
+        self.__lock.acquire(True)
+        self.__file.flush()
+        self.__lock.release()
+
+    def writeRecord(self,time,count,likelihood,position=None,estimate=(0.0,0.0)):
+        """
+            Writes a single record to the file.  The likelihood variable is a
+            mapping of position to likelihood as returned by the
+            InferenceEngine's infer() method.
+        """
+        if position is None:
+            position = -1
+
+        data = RECORD.pack(time, count, position, estimate[0], estimate[1]) + \
+                self.__values.pack(*[likelihood[pos] for pos in self.positions])
+
+        self.__lock.acquire(True)
+        try:
+            self.__file.write(data)
+        finally:
+            self.__lock.release()
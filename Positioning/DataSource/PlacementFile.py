@@ -0,0 +1,85 @@
+"""
+    This module contains a function to parse a placement file.
+
+    A placement file records where each tag was placed in the room, it is
+    a comma separated values file with some special features.
+        - Whitespace lines are ignored
+        - Lines starting with a '#' character are ignored (for commenting)
+
+    Each line of data places a single tag.  The expected columns are:
+        Tag                 : The tag alias defined in Thesis.constants or
+                              the tag's ID
+        Position            : integer, the position number of the tag
+    
+    The placement of tags which move can be given with an optional third
+    column, in which case a tag may have a line for every position it was
+    moved to:
+        Time                : floating point number, the time the tag was
+                              placed at the position
+"""
+from Thesis.constants import known_tags
+from bisect import bisect_right
+import re
+
+def ParsePlacementFile(filename):
+    """
+        Parses a placement file and returns a dictionary whose keys are the
+        tag IDs (aliases are resolved using the known_tags global) and whose
+        values are the position numbers.  A tag placed more than once is
+        given the position of its last line.
+    """
+    PlacementFile = open(filename, "r")
+    Placement = dict()
+    try:
+        for line in PlacementFile:
+            # If the line is empty/whitespace or starts with a '#' character ignore it
+            if line.startswith("#") or len(re.sub("\s+","",line)) == 0:
+                continue
+
+            (tag,pos) = [col.strip() for col in line.split(",")][:2]
+
+            Placement[known_tags.get(tag,tag)] = int(pos)
+    finally:
+        PlacementFile.close()
+
+    return Placement
+
+def ParsePlacementHistory(filename):
+    """
+        Parses a placement file and returns a dictionary whose keys are the
+        tag IDs and whose values are lists of (time, position) tuples in
+        order of time.  Lines without a time place the tag from the start.
+    """
+    PlacementFile = open(filename, "r")
+    History = dict()
+    try:
+        for line in PlacementFile:
+            # If the line is empty/whitespace or starts with a '#' character ignore it
+            if line.startswith("#") or len(re.sub("\s+","",line)) == 0:
+                continue
+
+            cols = [col.strip() for col in line.split(",")]
+            time = float("-inf")
+            if len(cols) > 2:
+                time = float(cols[2])
+
+            History.setdefault(known_tags.get(cols[0],cols[0]), []).append( (time,int(cols[1])) )
+    finally:
+        PlacementFile.close()
+
+    for moves in History.values():
+        moves.sort()
+    return History
+
+def PlacementAt(history,time):
+    """
+        Returns a dictionary of the position of every tag of a history
+        returned by ParsePlacementHistory at the time 'time'.  Tags which
+        were not yet placed are left out.
+    """
+    placement = dict()
+    for tag,moves in history.items():
+        i = bisect_right(moves, (time,float("inf")))
+        if i > 0:
+            placement[tag] = moves[i-1][1]
+    return placement
@@ -3,46 +3,152 @@
     an Observation Dump File.
 """
 from Protocol.GAORfidReceiver import Server
+from Positioning.DataSource.CalibrationFile import GainInformation
+from Positioning.Identifiers import Observation, CountDelta
+from Positioning import Metrics, Identifiers
 import threading, time
 
+class GainScheduler():
+    """
+        The GainScheduler class decides how many samples a receiver takes at
+        each gain level during one sweep.  Rather than taking the same number
+        of samples at every gain level, the samples of a sweep are shared out
+        in proportion to how informative each gain level of the receiver is
+        according to the calibration data (see GainInformation).  A share of
+        the samples is always spread evenly over every gain level so that no
+        gain level is ever left unobserved.
+    """
+    def __init__(self,CaliData,n,explore=0.1):
+        """
+            Constructs a GainScheduler instance.
+            
+            The CaliData should be the calibration data dictionary returned by
+            ParseCalibrationFile.
+            
+            Each sweep takes as many samples as a fixed sweep of 'n' samples
+            per gain level would, that is 32 * n.  The explore variable is the
+            fraction of those samples spread evenly over every gain level.
+        """
+        self.information = GainInformation(CaliData)
+        self.number = n
+        self.explore = explore
+        self.schedules = dict()
+        self.lock = threading.RLock()
+    
+    def schedule(self,recv):
+        """
+            Returns the sweep for the receiver 'recv' as a list of tuples of
+            the gain level and the number of samples to take, in increasing
+            order of gain.  Gain levels with no samples are left out.
+            Receivers without calibration data sweep every gain level evenly.
+        """
+        self.lock.acquire(True)
+        try:
+            if not self.schedules.has_key(recv):
+                budget = 32 * self.number
+                info = [self.information.get((recv,gain), 0.0) for gain in range(32)]
+                total = sum(info)
+                
+                if total <= 0:
+                    counts = [float(self.number)] * 32
+                else:
+                    counts = [budget * (self.explore / 32 + (1.0 - self.explore) * x / total) for x in info]
+                
+                self.schedules[recv] = [(gain,int(round(c))) for gain,c in enumerate(counts) if round(c) > 0]
+            
+            return self.schedules[recv]
+        finally:
+            self.lock.release()
+
 class ReceiverConnection(threading.Thread):
     """
         The ReceiverConnection class takes a RFID receiver connection and 
         continually sweeps up from the minimum gain level (0) to the maximum
         gain level (31).  At each gain level the receiver will be queried
         'n' times with 't' seconds between each query.  Data collected will
-        be offered to the queue 'queue' and then immediately forgotten.        
+        be offered to the queue 'queue' and then immediately forgotten.
+        
+        If a GainScheduler is given the number of queries at each gain level
+        is taken from the scheduler instead.
+        
+        If 'aggregate' is given the queries are counted by the connection
+        and offered as CountDelta records (see Positioning.Identifiers)
+        instead, one for each gain level of a sweep when it is zero, or one
+        every 'aggregate' seconds and at the end of each gain level
+        otherwise.
     """
-    def __init__(self,driver,queue,t,n):
+    def __init__(self,driver,queue,t,n,scheduler=None,aggregate=None):
         self.driver = driver
         self.queue = queue
         
         self.rate = t
         self.number = n
+        self.scheduler = scheduler
+        self.aggregate = aggregate
+        
+        labels = {"receiver":driver.addr}
+        self.roundtrip = Metrics.histogram("receiver_round_trip_seconds",
+                                           "Time taken by a receiver to answer a data request", labels)
+        self.observed = Metrics.counter("receiver_observations_total",
+                                        "Observations read from a receiver", labels)
         
         threading.Thread.__init__(self)
+    
+    def sweep(self):
+        """
+            Returns the list of (gain, samples) tuples of the next sweep.
+        """
+        if self.scheduler is None:
+            return [(gain,self.number) for gain in range(32)]
+        return self.scheduler.schedule(self.driver.addr)
         
+    def offer(self,observation):
+        # if the queue is iterable lets assume its a list of queues and
+        # write the observation to every one of them
+        if not hasattr(self.queue,'__iter__'):
+            self.queue.put(observation)
+        else:
+            for queue in self.queue:
+                queue.put(observation)
+    
     def run(self):
+        recv = Identifiers.receivers.intern(self.driver.addr)
         
         while True:
-            for gain in range(32):
+            for gain,number in self.sweep():
                 self.driver.setGain(gain)
                 
-                for i in range(self.number):
-                    taglist = []
-                    for detected in self.driver.getData():
-                        taglist.append( detected['id'] )
-                    observation = (self.driver.addr,gain,taglist,time.time())
+                # The counts of the current CountDelta when aggregating
+                samples = 0
+                counts = dict()
+                started = time.time()
+                
+                for i in range(number):
+                    start = Metrics.now()
+                    taglist = self.driver.getTagIds()
+                    if Metrics.enabled:
+                        self.roundtrip.observeSince(start)
+                        self.observed.inc()
                     
-                    # if the queue is iterable lets assume its a list of queues and
-                    # write the observation to every one of them
-                    if not hasattr(self.queue,'__iter__'):
-                        self.queue.put(observation)
+                    ctime = time.time()
+                    if self.aggregate is None:
+                        self.offer(Observation(recv,gain,Identifiers.tags.mask(taglist),ctime))
                     else:
-                        for queue in self.queue:
-                            queue.put(observation)
+                        samples += 1
+                        for tag in set(taglist):
+                            tagid = Identifiers.tags.intern(tag)
+                            counts[tagid] = counts.get(tagid,0) + 1
+                        
+                        if self.aggregate > 0 and ctime - started >= self.aggregate:
+                            self.offer(CountDelta(recv,gain,samples,counts,ctime))
+                            samples = 0
+                            counts = dict()
+                            started = ctime
                     
                     time.sleep(self.rate)
+                
+                if samples > 0:
+                    self.offer(CountDelta(recv,gain,samples,counts,ctime))
         
 class ReceiverServer(threading.Thread):
     """
@@ -51,15 +157,17 @@ class ReceiverServer(threading.Thread):
         delegate handling of those connections to another thread which will
         handle parsing and offering data to the queue.
     """
-    def __init__(self,queue,t,n):
+    def __init__(self,queue,t,n,scheduler=None,aggregate=None):
         """
             Constructs a server which will continually accept connections.
             When a connection is received the RFID receiver will be initially
             configured to query at a rate of 't' seconds and take 'n' samples
-            per gain level.  See ReceiverConnection class for details.
+            per gain level, or as many as the GainScheduler 'scheduler'
+            decides if one is given.  See ReceiverConnection class for details.
             
             For each observation made the observation will be offered to the
-            queue 'queue'. 
+            queue 'queue', or if 'aggregate' is given the observations are
+            offered as CountDelta records, see the ReceiverConnection class.
         """
         self.server = Server()
         self.server.connect()
@@ -67,6 +175,8 @@ class ReceiverServer(threading.Thread):
         self.queue = queue
         self.rate = t
         self.count = n
+        self.scheduler = scheduler
+        self.aggregate = aggregate
         
         threading.Thread.__init__(self)
     
@@ -75,5 +185,6 @@ class ReceiverServer(threading.Thread):
         while True:
             drv = self.server.getNextConnection()
 
-            thread = ReceiverConnection(driver=drv,queue=self.queue,t=self.rate,n=self.count)
+            thread = ReceiverConnection(driver=drv,queue=self.queue,t=self.rate,n=self.count,
+                                        scheduler=self.scheduler,aggregate=self.aggregate)
             thread.start()
\ No newline at end of file
@@ -3,6 +3,8 @@
     observations.
 """
 from Thesis.constants import known_hosts 
+from Positioning.Identifiers import Observation
+from Positioning import Identifiers
 import threading, time, random
 
 class Simulator(threading.Thread):
@@ -47,6 +49,10 @@ class Simulator(threading.Thread):
         self.pos = self.movement[0]
         self.tag = tag
         
+        # Intern the receivers and the tag once rather than every observation
+        self.receivers = [(recv,Identifiers.receivers.intern(recv)) for recv in known_hosts.values()]
+        self.mask = Identifiers.tags.mask([tag])
+        
         threading.Thread.__init__(self)
     
     def run(self):
@@ -56,15 +62,15 @@ class Simulator(threading.Thread):
             # Go through the expected power levels
             for gain in range(32):
                 # Go through every expected receiver
-                for recv in known_hosts.values():
+                for recv,recvid in self.receivers:
                     # find the probability of detecting the tag at the current
                     # position and make a probability test to determine if it
                     # was detected
                     p = self.cdata.get((recv, gain, self.pos))
                     if random.random() < p:
-                        observation = (recv, gain, [self.tag], ctime)
+                        observation = Observation(recvid, gain, self.mask, ctime)
                     else:
-                        observation = (recv, gain, [], ctime)
+                        observation = Observation(recvid, gain, 0, ctime)
                         
                     # if the queue is iterable lets assume its a list of queues and
                     # write the observation to every one of them
@@ -0,0 +1,276 @@
+"""
+    This module contains the Interner class, which assigns small integer ids
+    to receiver addresses and tag IDs, and the Observation and CountDelta
+    records which carry observations through the pipeline using those ids.
+
+    Names are interned at the edges of the pipeline (the data sources and
+    the dump file writer), so the observation managers never hash strings
+    or search lists of tags.  The detected tags of an observation are held
+    as a bitmask, bit i being set if the tag with id i was detected.
+
+    The receivers and tags globals are the interners used by every part of
+    the pipeline.  They are seeded with the known_hosts and known_tags
+    globals from the Thesis.constants module, in sorted order, so the known
+    receivers and tags always have the same ids.
+
+    Long running programs which see many transient tags can let the tags
+    interner reuse the ids of tags no observation manager holds and which
+    have not been seen for a while, see the reuse() method, so the ids and
+    the width of every bitmask stay bounded.
+"""
+from __future__ import with_statement
+from Thesis.constants import known_hosts, known_tags
+from collections import namedtuple, deque
+import threading, time
+
+class Interner(object):
+    """
+        The Interner class assigns consecutive integer ids, starting at zero,
+        to names in the order they are first seen.  Ids are only reused once
+        reuse() has been called, and never those of the names it was seeded
+        with.
+    """
+    def __init__(self,names=(),reserve=1024):
+        """
+            Constructs an Interner seeded with the names of 'names'.  When
+            ids are reused, at least 'reserve' free ids are kept back so an
+            id is never handed out again soon after it was freed.
+        """
+        self.ids = dict()
+        self.names = []
+        self.lock = threading.RLock()
+
+        # The number of observation managers holding each id, the freed ids
+        # oldest first and the ids interned since the last collection, which
+        # is None while ids are not reused
+        self.holds = dict()
+        self.free = deque()
+        self.freed = set()
+        self.reserve = reserve
+        self.recent = None
+        self.period = None
+        self.collected = None
+
+        for name in names:
+            self.intern(name)
+        self.seeded = len(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self,name):
+        return name in self.ids
+
+    def intern(self,name):
+        """
+            Returns the id of 'name', assigning it the next id if it has
+            never been seen before.
+        """
+        id = self.ids.get(name)
+        if id is None:
+            with self.lock:
+                id = self.ids.get(name)
+                if id is None:
+                    if self.period is not None and time.time() >= self.collected + self.period:
+                        self.collect()
+
+                    if len(self.free) > self.reserve:
+                        id = self.free.popleft()
+                        self.freed.remove(id)
+                        self.names[id] = name
+                    else:
+                        id = len(self.names)
+                        self.names.append(name)
+                    self.ids[name] = id
+        if self.recent is not None:
+            self.recent.add(id)
+        return id
+
+    def reuse(self,period):
+        """
+            Lets the ids of names which no observation manager holds, and
+            which have not been interned for 'period' seconds, be freed and
+            given to new names.  Records made before an id was freed still
+            name it correctly until it is given out again, which only happens
+            once more than the reserve of ids have been freed after it.
+        """
+        with self.lock:
+            self.period = period
+            self.collected = time.time()
+            self.recent = set()
+
+    def collect(self):
+        """
+            Frees the ids which are not held and were not interned since the
+            last collection.  The caller must hold the lock.
+        """
+        recent = self.recent
+        self.recent = set()
+        self.collected = time.time()
+
+        for id in xrange(self.seeded, len(self.names)):
+            if id in recent or id in self.holds or id in self.freed:
+                continue
+            name = self.names[id]
+            if self.ids.get(name) == id:
+                del self.ids[name]
+            self.free.append(id)
+            self.freed.add(id)
+
+    def hold(self,id):
+        """
+            Marks 'id' as used by an observation manager, it is not freed
+            until every holder has released it.
+        """
+        with self.lock:
+            self.holds[id] = self.holds.get(id,0) + 1
+
+            # A record made before the id was freed may still carry it
+            if id in self.freed:
+                self.freed.remove(id)
+                self.free.remove(id)
+                self.ids.setdefault(self.names[id], id)
+
+    def release(self,id):
+        """
+            Marks 'id' as no longer used by one of its holders.
+        """
+        with self.lock:
+            count = self.holds.get(id,0) - 1
+            if count > 0:
+                self.holds[id] = count
+            else:
+                self.holds.pop(id,None)
+
+    def lookup(self,name):
+        """
+            Returns the id of 'name', or None if it has never been seen or
+            its id has been freed.
+        """
+        return self.ids.get(name)
+
+    def name(self,id):
+        """
+            Returns the name that was assigned the id 'id', or that was last
+        assigned it if it has been freed.
+        """
+        return self.names[id]
+
+    def mask(self,names):
+        """
+            Returns the bitmask of the ids of every name in 'names'.
+        """
+        result = 0
+        for name in names:
+            result |= 1 << self.intern(name)
+        return result
+
+    def unmask(self,mask):
+        """
+            Returns the list of names whose ids are set in the bitmask 'mask'.
+        """
+        return [self.names[id] for id in members(mask)]
+
+def members(mask):
+    """
+        Returns the list of ids set in the bitmask 'mask', in increasing
+        order.  Only the set bits are visited.
+    """
+    result = []
+    while mask:
+        low = mask & -mask
+        result.append(low.bit_length() - 1)
+        mask ^= low
+    return result
+
+receivers = Interner(sorted(known_hosts.values()))
+tags = Interner(sorted(known_tags.values()))
+
+class Observation(namedtuple("Observation", "recv gain detected time")):
+    """
+        A single observation of a receiver: the receiver's id, the gain
+        level, the bitmask of the ids of the detected tags and the time of
+        the observation.
+    """
+    __slots__ = ()
+
+    # Every Observation record is a single observation
+    samples = 1
+
+    @classmethod
+    def fromNames(cls,recv,gain,taglist,time):
+        """
+            Creates an Observation from a receiver address and a list of tag
+            IDs, interning them.
+        """
+        return cls(receivers.intern(recv), gain, tags.mask(taglist), time)
+
+    def names(self):
+        """
+            Returns the observation as a tuple of the receiver address, the
+            gain, the list of detected tag IDs and the time.
+        """
+        return (receivers.name(self.recv), self.gain, tags.unmask(self.detected), self.time)
+
+class CountDelta(namedtuple("CountDelta", "recv gain samples counts time")):
+    """
+        The counts of a number of observations of a receiver at a single gain
+        level: the receiver's id, the gain level, the number of observations,
+        a dictionary mapping the id of each detected tag to the number of
+        observations it was detected in, and the time of the last of the
+        observations.
+    """
+    __slots__ = ()
+
+    @property
+    def detected(self):
+        """
+            The bitmask of the ids of the tags detected at least once.
+        """
+        mask = 0
+        for tag,count in self.counts.items():
+            if count > 0:
+                mask |= 1 << tag
+        return mask
+
+    @classmethod
+    def fromNames(cls,recv,gain,samples,tagcounts,time):
+        """
+            Creates a CountDelta from a receiver address and a dictionary
+            mapping tag IDs to their number of detections, interning them.
+        """
+        counts = dict((tags.intern(tag),count) for tag,count in tagcounts.items())
+        return cls(receivers.intern(recv), gain, samples, counts, time)
+
+    @classmethod
+    def fromObservation(cls,obs):
+        """
+            Creates the CountDelta of a single Observation record.
+        """
+        return cls(obs.recv, obs.gain, 1, dict.fromkeys(members(obs.detected), 1), obs.time)
+
+    def names(self):
+        """
+            Returns the delta as a tuple of the receiver address, the gain,
+            a dictionary mapping the detected tag IDs to their number of
+            detections, the time and the number of observations.
+        """
+        counts = dict((tags.name(tag),count) for tag,count in self.counts.items())
+        return (receivers.name(self.recv), self.gain, counts, self.time, self.samples)
+
+def coalesce(first,second):
+    """
+        Returns the CountDelta of the observations of both 'first' and
+        'second', each an Observation or CountDelta record of the same
+        receiver and gain level.
+    """
+    if isinstance(first,Observation):
+        first = CountDelta.fromObservation(first)
+    if isinstance(second,Observation):
+        second = CountDelta.fromObservation(second)
+
+    counts = dict(first.counts)
+    for tag,count in second.counts.items():
+        counts[tag] = counts.get(tag,0) + count
+    return CountDelta(first.recv, first.gain, first.samples + second.samples, counts,
+                      max(first.time, second.time))
@@ -6,22 +6,56 @@
     module. 
 """
 from Thesis.constants import known_hosts, room_positions
-from math import log
+from Positioning.DataSource.CalibrationFile import CalibrationIndex
+from Positioning.SpatialIndex import room_index
+from Positioning import Metrics, Identifiers
+from math import log, exp
+import heapq
 
-def logbinomial(x, n, p):
+LATENCY = Metrics.histogram("inference_seconds", "Time taken to infer the likelihoods of a tag")
+
+def logchoose(n, x):
+    """
+        This function returns the logarithm of the binomial coefficient,
+        the number of ways to choose x of n.
+    """
+    logfac = lambda k: sum(log(x) for x in range(1,k+1))
+    return logfac(n) - logfac(x) - logfac(n-x)
+
+def logbinomial(x, n, p, coefficient=None):
     """
         This function is used to infer the likelihood of a single 
         position.  It is simply an implementation of the base 10
         logarithm of the binomial function. 
+        
+        The coefficient does not depend on p, when evaluating many values
+        of p for the same x and n it can be calculated once with the
+        logchoose function and passed in.
     """
     if x == 0 or p == 0:
         return 0
     try:
-        logfac = lambda k: sum(log(x) for x in range(1,k+1))
-        return logfac(n) - logfac(x) - logfac(n-x) + x*log(p) + (n-x)*log(1.0-p)
+        if coefficient is None:
+            coefficient = logchoose(n, x)
+        return coefficient + x*log(p) + (n-x)*log(1.0-p)
     except:
         raise Exception("logbinominal(%d, %d, %f) error" % (x, n, p))
 
+def centroid(likelihood, positions=room_positions):
+    """
+        This function turns the likelihood of every position into a single
+        continuous (x,y) estimate.  Each position's coordinates are weighted
+        by its likelihood (converted from the logarithm and normalised) so
+        the estimate can fall between the discrete positions.
+    """
+    highest = max(likelihood.values())
+    weights = dict((pos, exp(value - highest)) for pos,value in likelihood.items())
+    total   = sum(weights.values())
+    
+    x = sum(positions[pos][0] * w for pos,w in weights.items()) / total
+    y = sum(positions[pos][1] * w for pos,w in weights.items()) / total
+    return (x,y)
+
 class InferenceEngine():
     """
         The InferenceEngine class takes an ObservationManager and a set
@@ -30,7 +64,7 @@ class InferenceEngine():
         the calibration data to infer the likelihood of every position.
     """
     
-    def __init__(self,ObservationManager,CaliData):
+    def __init__(self,ObservationManager,CaliData,threshold=0.0):
         """
             Constructs an InferenceEngine instance.
             
@@ -43,32 +77,144 @@ class InferenceEngine():
             (R,G,P) where R is the receiver, G is the gain level and P is the
             position.  The value of this dictionary should be the probability
             of detection at the Key.
+            
+            Only the (R,G) cells of the calibration data which can tell the
+            positions apart are evaluated, see the CalibrationIndex class.
+            The threshold variable is passed on to the CalibrationIndex, the
+            default of zero never changes the result.
         """
         self.obsman = ObservationManager
         self.cdata = CaliData
+        self.index = CalibrationIndex(CaliData, room_positions.keys(), known_hosts.values(), threshold)
+        
+        # The observation managers identify receivers by their interned ids
+        self.cells = [(Identifiers.receivers.intern(recv),gain,probs) for recv,gain,probs in self.index]
 
-    def infer(self,tag):
+    def infer(self,tag,positions=None):
         """
             Infers the likelihood of a tag existing at every location defined
             in the room_positions variable from the Thesis.constants module.
             
             Tag is the ID number of the tag to be inferred.
             
+            If a list of positions is given only those positions are
+            inferred, the rest are not scored at all.
+            
             Returns a dictionary whose keys are the positions defined in the
             keys of room_positions and whose value is the inferred likelihood.
         """
-        likelihood = dict()
-        for pos in room_positions.keys():
-            likelihood[pos] = 0
-            for recv in known_hosts.values():
-                for gain in range(32):
-                    p                = self.cdata[(recv,gain,pos)]
-                    n,x              = self.obsman.get(tag,recv,gain)
-                    likelihood[pos] += logbinomial(x, n, p)
-                    
-        lowest = min(likelihood[x] for x in room_positions.keys())
+        start = Metrics.now()
+        if positions is None:
+            positions = room_positions.keys()
+        
+        likelihood = dict((pos,0) for pos in positions)
+        for n,x,coefficient,probs in self.__cells(tag):
+            for pos in positions:
+                likelihood[pos] += logbinomial(x, n, probs[pos], coefficient)
         
-        for x in room_positions.keys():
+        if len(likelihood) == 0:
+            return likelihood
+        
+        lowest = min(likelihood.values())
+        
+        for x in positions:
             likelihood[x] -= lowest 
         
-        return likelihood
\ No newline at end of file
+        if Metrics.enabled:
+            LATENCY.observeSince(start)
+        return likelihood
+    
+    def inferTopK(self,tag,k):
+        """
+            Finds the k most likely positions of the tag without scoring
+            every position in full.  Each position's score is accumulated
+            one cell at a time and abandoned as soon as even the best
+            possible outcome of its remaining cells could not place it in
+            the top k.
+            
+            Returns a list of (position, log likelihood) tuples, most likely
+            first.  Unlike infer() the log likelihoods are not shifted by the
+            lowest value, as most positions are never fully scored.
+        """
+        cells = self.__cells(tag)
+        
+        # Score the cells with the most detections first, they separate the
+        # positions quickest
+        cells.sort(key=lambda cell: -cell[1])
+        
+        best = []
+        for pos in room_positions.keys():
+            score = 0.0
+            pruned = False
+            for n,x,coefficient,probs in cells:
+                # Every term is a log probability and never positive, so the
+                # score can only fall from here
+                if len(best) == k and score < best[0][0]:
+                    pruned = True
+                    break
+                score += logbinomial(x, n, probs[pos], coefficient)
+            
+            if pruned:
+                continue
+            if len(best) < k:
+                heapq.heappush(best, (score,pos))
+            elif score > best[0][0]:
+                heapq.heapreplace(best, (score,pos))
+        
+        return [(pos,score) for score,pos in sorted(best, reverse=True)]
+    
+    def inferNear(self,tag,center,radius):
+        """
+            Infers the likelihood of the tag being at each position within
+            'radius' of the (x,y) point 'center', such as the previous
+            estimate of the tag, see infer().
+        """
+        cx,cy = center
+        return self.infer(tag, room_index.radius(cx, cy, radius))
+    
+    def inferWithin(self,tag,xmin,ymin,xmax,ymax):
+        """
+            Infers the likelihood of the tag being at each position within
+            the given bounding box, see infer().
+        """
+        return self.infer(tag, room_index.bbox(xmin, ymin, xmax, ymax))
+    
+    def __cells(self,tag):
+        """
+            Returns the informative cells with detections of the tag as a
+            list of tuples of N, X, the binomial coefficient and the
+            dictionary of probabilities of the cell.
+        """
+        # Take a single consistent snapshot of the tag's counts rather than
+        # querying the manager (and taking its locks) for every cell
+        tag = Identifiers.tags.lookup(tag)
+        if tag is None:
+            return []
+        counts = self.obsman.snapshot([tag])
+        
+        cells = []
+        for recv,gain,probs in self.cells:
+            n,x = counts.get(tag,recv,gain)
+            
+            # Cells without detections add nothing to any position
+            if x == 0:
+                continue
+            
+            cells.append( (n,x,logchoose(n, x),probs) )
+        
+        return cells
+    
+    def estimate(self,tag):
+        """
+            Infers a continuous (x,y) estimate of the tag's location in the
+            coordinates of room_positions, see the centroid() function.
+        """
+        return centroid(self.infer(tag))
+    
+    def nearest(self,tag):
+        """
+            Returns the position nearest to the tag's continuous estimate,
+            see estimate().
+        """
+        x,y = self.estimate(tag)
+        return room_index.nearest(x, y)
\ No newline at end of file
@@ -0,0 +1,331 @@
+"""
+    This module contains lightweight counters, gauges and histograms used to
+    report the performance of the positioning pipeline, and the sinks which
+    publish them.
+
+    Metrics are registered once, usually at import time, with the counter(),
+    gauge() and histogram() functions and are identified by their name and
+    an optional dictionary of labels.  Nothing is recorded until enable() is
+    called, the instrumented code checks the module's enabled flag before
+    doing any work so the overhead is a single attribute lookup otherwise.
+
+    The metrics are rendered in the Prometheus text exposition format by
+    the render() function.  Three sinks publish them:
+        LogSink               Periodically prints a one line summary.
+        FileSink              Periodically rewrites a file with render().
+        HTTPSink              Serves render() on a local HTTP port.
+
+    The StartSink() function enables the metrics and starts a sink from a
+    command line style specification, see the --metrics option of infer.py.
+"""
+from __future__ import with_statement
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from timeit import default_timer
+import threading, time, sys, os
+
+# Set by enable() and disable(), instrumented code checks it before recording
+enabled = False
+
+# The registered metrics in registration order
+registry = []
+registrylock = threading.RLock()
+
+# Histogram buckets suited to latencies in seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def now():
+    """
+        Returns a timestamp for measuring a duration, use with
+        Histogram.observeSince().
+    """
+    return default_timer()
+
+class Metric(object):
+    """
+        The base class of every metric, it holds the name, help text and
+        labels of the metric.
+    """
+    kind = "untyped"
+
+    def __init__(self,name,help="",labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or dict()
+        self.lock = threading.RLock()
+
+    def labelstring(self,extra=None):
+        labels = dict(self.labels)
+        if extra:
+            labels.update(extra)
+        if len(labels) == 0:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (key,labels[key]) for key in sorted(labels))
+
+class Counter(Metric):
+    """
+        A value which only ever increases, such as the number of
+        observations ingested.
+    """
+    kind = "counter"
+
+    def __init__(self,name,help="",labels=None):
+        Metric.__init__(self,name,help,labels)
+        self.value = 0
+
+    def inc(self,amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        return [(self.name + self.labelstring(), self.value)]
+
+class Gauge(Metric):
+    """
+        A value which can go up and down, such as the depth of a queue.  If
+        a function is given it is called for the value whenever the gauge is
+        read, so nothing needs to be recorded on the hot path.
+    """
+    kind = "gauge"
+
+    def __init__(self,name,help="",labels=None,function=None):
+        Metric.__init__(self,name,help,labels)
+        self.function = function
+        self.value = 0
+
+    def set(self,value):
+        self.value = value
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return float("nan")
+        return self.value
+
+    def samples(self):
+        return [(self.name + self.labelstring(), self.get())]
+
+class Histogram(Metric):
+    """
+        Counts observed values, such as latencies, into cumulative buckets
+        and keeps their count and sum.
+    """
+    kind = "histogram"
+
+    def __init__(self,name,help="",labels=None,buckets=LATENCY_BUCKETS):
+        Metric.__init__(self,name,help,labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self,value):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for i,bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def observeSince(self,start):
+        """
+            Observes the time in seconds since 'start', a value returned by
+            the now() function.
+        """
+        self.observe(default_timer() - start)
+
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.sum / self.count
+
+    def samples(self):
+        with self.lock:
+            result = []
+            cumulative = 0
+            for bound,count in zip(self.buckets,self.counts):
+                cumulative += count
+                result.append((self.name + "_bucket" + self.labelstring({"le":repr(bound)}), cumulative))
+            result.append((self.name + "_bucket" + self.labelstring({"le":"+Inf"}), self.count))
+            result.append((self.name + "_sum" + self.labelstring(), self.sum))
+            result.append((self.name + "_count" + self.labelstring(), self.count))
+            return result
+
+def register(metric):
+    """
+        Registers a metric, returning the already registered metric of the
+        same name and labels if there is one.
+    """
+    with registrylock:
+        for existing in registry:
+            if existing.name == metric.name and existing.labels == metric.labels:
+                return existing
+        registry.append(metric)
+        return metric
+
+def unregister(metric):
+    with registrylock:
+        if metric in registry:
+            registry.remove(metric)
+
+def counter(name,help="",labels=None):
+    return register(Counter(name,help,labels))
+
+def gauge(name,help="",labels=None,function=None):
+    """
+        Registers a gauge.  Unlike the other metrics an existing gauge of the
+        same name and labels is replaced, as its function is usually bound to
+        the object being measured.
+    """
+    metric = Gauge(name,help,labels,function)
+    with registrylock:
+        for existing in registry:
+            if existing.name == metric.name and existing.labels == metric.labels:
+                registry[registry.index(existing)] = metric
+                return metric
+        registry.append(metric)
+        return metric
+
+def histogram(name,help="",labels=None,buckets=LATENCY_BUCKETS):
+    return register(Histogram(name,help,labels,buckets))
+
+def render():
+    """
+        Returns every registered metric in the Prometheus text exposition
+        format.  Metrics of the same name are grouped together.
+    """
+    with registrylock:
+        metrics = sorted(registry, key=lambda metric: metric.name)
+
+    lines = []
+    described = set()
+    for metric in metrics:
+        if metric.name not in described:
+            described.add(metric.name)
+            if metric.help:
+                lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+        for name,value in metric.samples():
+            lines.append("%s %s" % (name, value))
+    return "\n".join(lines) + "\n"
+
+def summary():
+    """
+        Returns a single line summary of every registered metric, histograms
+        are shown as their count and mean.
+    """
+    with registrylock:
+        metrics = list(registry)
+
+    parts = []
+    for metric in metrics:
+        name = metric.name + metric.labelstring()
+        if isinstance(metric, Histogram):
+            parts.append("%s=%d/%.6fs" % (name, metric.count, metric.mean()))
+        elif isinstance(metric, Gauge):
+            parts.append("%s=%s" % (name, metric.get()))
+        else:
+            parts.append("%s=%s" % (name, metric.value))
+    return " ".join(parts)
+
+class LogSink(threading.Thread):
+    """
+        Writes the summary() line to a stream (standard error by default)
+        every 'interval' seconds.
+    """
+    def __init__(self,interval=10.0,stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.stream.write("METRICS: %s\n" % summary())
+            self.stream.flush()
+
+class FileSink(threading.Thread):
+    """
+        Rewrites the file 'filename' with render() every 'interval' seconds.
+        The file is replaced in a single rename so readers never see it
+        half written.
+    """
+    def __init__(self,filename,interval=10.0):
+        self.filename = filename
+        self.interval = interval
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            temporary = self.filename + ".tmp"
+            output = open(temporary, "w")
+            try:
+                output.write(render())
+            finally:
+                output.close()
+            os.rename(temporary, self.filename)
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self,format,*args):
+        pass
+
+class HTTPSink(threading.Thread):
+    """
+        Serves render() to every GET request on the port 'port' of the
+        address 'address' (localhost by default).
+    """
+    def __init__(self,port=9100,address="127.0.0.1"):
+        self.server = HTTPServer((address,port), MetricsRequestHandler)
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+    def run(self):
+        self.server.serve_forever()
+
+def StartSink(spec):
+    """
+        Enables the metrics and starts the sink described by 'spec', which is
+        one of:
+            log[:INTERVAL]        A LogSink, every 10 seconds by default.
+            file:FILENAME[:INTERVAL]
+                                  A FileSink, every 10 seconds by default.
+            http[:PORT]           An HTTPSink, on port 9100 by default.
+
+        Returns the started sink.
+    """
+    parts = spec.split(":")
+    kind = parts[0]
+
+    if kind == "log":
+        sink = LogSink(*[float(x) for x in parts[1:2]])
+    elif kind == "file" and len(parts) > 1:
+        sink = FileSink(parts[1], *[float(x) for x in parts[2:3]])
+    elif kind == "http":
+        sink = HTTPSink(*[int(x) for x in parts[1:2]])
+    else:
+        raise Exception("Unknown metrics sink: %s" % spec)
+
+    enable()
+    sink.start()
+    return sink
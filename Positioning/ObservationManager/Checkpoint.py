@@ -0,0 +1,97 @@
+"""
+    This module contains the functions used by the observation managers to
+    write their state to a checkpoint file and to read it back, and the
+    Checkpointer thread which checkpoints a manager periodically.
+
+    A checkpoint lets a restarted program restore the counts or windows of
+    its observation manager and then replay only the observations made
+    after the checkpoint, see the after variable of the DumpFileReader
+    class, rather than replaying every observation ever made.
+
+    The file is a binary pickle of a dictionary built by the saveState()
+    method of the manager.  The counts and times are held in arrays so
+    they are stored as raw machine values.  Receivers and tags are stored
+    by name, as the ids of the Positioning.Identifiers module are only
+    valid within a single run of a program.
+"""
+from __future__ import with_statement
+from Positioning import Metrics
+import cPickle, threading, time, os
+
+# Written at the start of every checkpoint, the version changes whenever
+# the format of the state does
+MAGIC = "OBSCHECKPOINT"
+VERSION = 3
+
+CHECKPOINT = Metrics.histogram("checkpoint_seconds", "Time taken to write a checkpoint")
+
+def WriteCheckpoint(filename,kind,state):
+    """
+        Writes the state dictionary of a manager of the type 'kind' (such as
+        "static" or "dynamic") to the file 'filename'.  The file is replaced
+        in a single rename so a crash never leaves it half written.
+    """
+    temporary = filename + ".tmp"
+    output = open(temporary, "wb")
+    try:
+        cPickle.dump((MAGIC,VERSION,kind,state), output, cPickle.HIGHEST_PROTOCOL)
+    finally:
+        output.close()
+
+    # Windows will not rename over an existing file
+    if os.name == "nt" and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(temporary, filename)
+
+def ReadCheckpoint(filename,kind):
+    """
+        Reads the state dictionary from the checkpoint file 'filename',
+        raising an exception if it was not written by a manager of the type
+        'kind' or was written by another version of this module.
+    """
+    input = open(filename, "rb")
+    try:
+        magic,version,written,state = cPickle.load(input)
+    finally:
+        input.close()
+
+    if magic != MAGIC or version != VERSION:
+        raise Exception("Unsupported checkpoint file: %s" % filename)
+    if written != kind:
+        raise Exception("Checkpoint file %s is of a %s manager, not %s" % (filename,written,kind))
+    return state
+
+class Checkpointer(threading.Thread):
+    """
+        The Checkpointer class calls the saveState() method of a manager
+        every 'interval' seconds until stop() is called.
+    """
+    def __init__(self,manager,filename,interval=60.0):
+        self.manager = manager
+        self.filename = filename
+        self.interval = interval
+        self.running = True
+        self.lock = threading.RLock()
+
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+    def stop(self):
+        """
+            Stops the thread and writes a final checkpoint.
+        """
+        self.running = False
+        self.checkpoint()
+
+    def checkpoint(self):
+        start = Metrics.now()
+        with self.lock:
+            self.manager.saveState(self.filename)
+        if Metrics.enabled:
+            CHECKPOINT.observeSince(start)
+
+    def run(self):
+        while self.running:
+            time.sleep(self.interval)
+            if self.running:
+                self.checkpoint()
@@ -5,89 +5,469 @@
     The Dynamic implementation of this manager essentially stores
     observations in a hash table.  The key of this hash table is as
     always (R,G) where R is the receiver and G is the gain level of
-    the receiver.  While not efficient with memory this manager does
-    feature the ability to prune its own data strategically, making
-    tracking moving objects conceivably possible.  The manner it uses
-    to achieve this is simply the sliding window approach.
+    the receiver.  This manager features the ability to prune its own
+    data strategically, making tracking moving objects conceivably
+    possible.  The manner it uses to achieve this is simply the sliding
+    window approach.
+    
+    The table is sparse, the time of every observation is kept once per
+    (R,G) key and shared by every tag, and each tag only keeps the times
+    it was detected.  Memory therefore grows with the number of
+    detections rather than with the number of tags times the number of
+    observations, and can be capped by evicting the tags which were
+    detected least recently.
+    
+    Receivers and tags are identified by the integer ids assigned by the
+    Positioning.Identifiers module.  The manager can discover receivers and
+    tags it was not given as they are first seen, and forget tags which
+    have not been detected for a while.
+    
+    The windows can be written to a checkpoint file and restored from it,
+    see the Positioning.ObservationManager.Checkpoint module.
+    
+    CountDelta records are held as a single weighted entry at the time of
+    their last observation, rather than one entry per observation.
 """
 from __future__ import with_statement
 from Thesis.constants import *
+from Positioning.ObservationManager.Snapshot import Snapshot
+from Positioning.ObservationManager.Checkpoint import WriteCheckpoint, ReadCheckpoint
+from Positioning import Metrics, Identifiers
+from collections import deque
+from array import array
 import threading, time
 
+INGESTED = Metrics.counter("observations_ingested_total", "Observations put into the manager",
+                            {"manager":"dynamic"})
+PRUNE    = Metrics.histogram("observation_prune_seconds", "Time taken to prune every table",
+                            {"manager":"dynamic"})
+EVICTED  = Metrics.counter("tags_evicted_total", "Tags removed to keep within the memory limit",
+                            {"manager":"dynamic"})
+
+class Window(object):
+    """
+        The Window class holds the times of a series of observations, oldest
+        first, each with the number of observations it stands for, and the
+        total of those numbers.  Observations made at the same time share a
+        single entry.
+    """
+    __slots__ = ("times","weights","total")
+    
+    def __init__(self,times=(),weights=()):
+        self.times = deque(times)
+        self.weights = deque(weights)
+        self.total = sum(self.weights)
+    
+    def __len__(self):
+        return len(self.times)
+    
+    def add(self,time,weight=1):
+        """
+            Adds 'weight' observations made at the time 'time', returning
+            the number of entries added.
+        """
+        self.total += weight
+        if self.times and self.times[-1] == time:
+            self.weights[-1] += weight
+            return 0
+        self.times.append(time)
+        self.weights.append(weight)
+        return 1
+    
+    def prune(self,expire):
+        """
+            Removes the observations older than the time 'expire', returning
+            the number of entries removed.
+        """
+        removed = 0
+        times, weights = self.times, self.weights
+        while times and times[0] < expire:
+            times.popleft()
+            self.total -= weights.popleft()
+            removed += 1
+        return removed
+    
+    def since(self,time):
+        """
+            Returns the number of observations made at or after the time
+            'time'.
+        """
+        total = 0
+        times, weights = self.times, self.weights
+        for i in xrange(len(times) - 1, -1, -1):
+            if times[i] < time:
+                break
+            total += weights[i]
+        return total
+
 class ObservationTable():
-    def __init__(self,window):
-        self.window = window
+    """
+        The ObservationTable class holds the Window of the times a single tag
+        was detected at each (R,G) key.  Keys without detections in the
+        window are not kept.  The size is the number of entries held.
+        
+        A table added while the manager is running has the time of the
+        observation the tag was first seen in as its start, and only the
+        shared observations from then on are counted until the window has
+        moved past it.
+    """
+    def __init__(self,start=None):
         self.table = dict()
-        self.locks = dict()
-                
-        for recv in known_hosts.values():
-            for gain in range(32):
-                self.table[(recv,gain)] = []
-                self.locks[(recv,gain)] = threading.RLock()
+        self.size = 0
+        self.start = start
     
-    def prune(self,ctime):
-        expire = ctime - self.window
+    def prune(self,expire):
+        """
+            Removes the detections older than the time 'expire' and returns
+            how many entries were removed.
+        """
+        removed = 0
+        for key,records in self.table.items():
+            removed += records.prune(expire)
+            if not records:
+                del self.table[key]
         
-        for recv,gain in self.table.keys():
-            key = (recv,gain)
-            with self.locks[key]:
-                new = [x for x in self.table[key] if x[0] >= expire]
-                self.table[key] = new 
+        # Every shared observation left in the window is after the start
+        if self.start is not None and self.start <= expire:
+            self.start = None
         
-    def get(self,recv,gain):
-        key = (recv,gain)
+        self.size -= removed
+        return removed
         
-        with self.locks[key]:
-            n = len(self.table[key])
-            x = len([x for x in self.table[key] if x[1]])
-            
-        return (n,x)
+    def get(self,key):
+        records = self.table.get(key)
+        return records is not None and records.total or 0
+    
+    def total(self,records):
+        """
+            Returns the number of observations of the shared Window 'records'
+            made since the table's start.
+        """
+        if self.start is None or not records.times or records.times[0] >= self.start:
+            return records.total
+        return records.since(self.start)
+    
+    def counts(self,totals):
+        """
+            Returns a dictionary mapping every (R,G) key of 'totals', the
+            shared observation Windows, to its (N,X) tuple.  The caller must
+            hold the manager's lock.
+        """
+        table = self.table
+        return dict((key,(self.total(records), key in table and table[key].total or 0))
+                        for key,records in totals.items())
     
-    def update(self,recv,gain,time,detected):
-        self.table[(recv,gain)].append( (time,detected) )
+    def update(self,key,time,weight=1):
+        """
+            Records 'weight' detections at the time 'time', returning the
+            number of entries added.
+        """
+        records = self.table.get(key)
+        if records is None:
+            records = self.table[key] = Window()
+        added = records.add(time,weight)
+        self.size += added
+        return added
 
 class ObservationsManager(threading.Thread):
-    def __init__(self,window,prunerate=0.1):
+    def __init__(self,window,prunerate=0.1,RecvList=known_hosts.values(),TagList=known_tags.values(),
+                 discover=False,expire=None,maxrecords=None):
+        """
+            Constructs an ObservationsManager keeping the observations of the
+            last 'window' seconds for the receivers of RecvList and the tags
+            of TagList, observations of any other receiver or tag are
+            ignored.
+            
+            If discover is set a receiver or tag seen for the first time is
+            added to the tables instead, its window starts from the
+            observation it was first seen in.  When expire is also given, tags
+            not detected within 'expire' seconds of the most recent
+            observation are removed from the tables, and are added again if
+            they are seen later.  A tag added again also starts from the
+            observation it was seen in.
+            
+            The maxrecords variable limits the number of detection entries
+            kept across every tag, each entry being the detections of a tag
+            at one (R,G) key and time however many they are.  When it is
+            exceeded the tags detected least recently are removed until a
+            tenth of the limit is free again, they are added again if they
+            are seen later.
+        """
         # Some variables which affect pruning
         self.mostrecent = 0
         self.rate = prunerate
+        self.window = window
         
-        # Create the observation tables for each expected tag
+        # The receivers and tags are kept by their interned ids
+        self.recvlist = set(Identifiers.receivers.intern(recv) for recv in RecvList)
+        
+        # The Window of every observation at each (R,G) key, shared by all
+        # of the tags, and the tables of detections of each expected tag
+        self.totals = dict()
         self.tables = dict()
-        for tagid in known_tags.values():
-            self.tables[tagid] = ObservationTable(window)
+        for tagid in [Identifiers.tags.intern(t) for t in TagList]:
+            self.tables[tagid] = ObservationTable()
+            Identifiers.tags.hold(tagid)
+        
+        # The mask of tracked has the bit of every tag a table is kept for
+        # set and the mask of tagmask the bit of every tag with a table, they
+        # differ once tags are removed.  Lastseen is the time each tag was
+        # last detected.
+        self.discover = discover
+        self.expire = expire
+        self.tagmask = 0
+        for tag in self.tables.keys():
+            self.tagmask |= 1 << tag
+        self.tracked = self.tagmask
+        self.lastseen = dict((tag,None) for tag in self.tables.keys())
+        self.nextexpire = None
+        
+        # The number of detection entries held by every table
+        self.maxrecords = maxrecords
+        self.records = 0
             
         self.observers = []
         self.observationCount = 0
+        
+        # A lock held while the tables are modified so that snapshots are
+        # taken of a single instant
+        self.lock = threading.RLock()
+        
+        Metrics.gauge("observation_records", "Detection entries held by the manager", {"manager":"dynamic"},
+                        function=lambda: self.records)
 
         # Initialize the thread
         threading.Thread.__init__(self)
         
     def put(self,reading):
-        recv,gain,detected,ctime = reading
+        """
+            Adds an Observation or CountDelta record (see
+            Positioning.Identifiers) to the shared observation Windows and to
+            the table of every detected tag.
+        """
+        recv,gain,detected,ctime = reading.recv,reading.gain,reading.detected,reading.time
+        samples = reading.samples
+        counts = None
+        if isinstance(reading,Identifiers.CountDelta):
+            counts = reading.counts
+        key = (recv,gain)
+        
+        with self.lock:
+            if recv not in self.recvlist:
+                if not self.discover:
+                    return
+                self.recvlist.add(recv)
             
-        for tag in known_tags.values():
-            self.tables[tag].update( recv, gain, ctime, tag in detected )
+            totals = self.totals.get(key)
+            if totals is None:
+                totals = self.totals[key] = Window()
+            totals.add(ctime,samples)
             
-        if ctime > self.mostrecent:
-            self.mostrecent = ctime
+            if detected:
+                self.detect(key,detected,ctime,counts)
+                
+            if ctime > self.mostrecent:
+                self.mostrecent = ctime
+                
+            self.observationCount = self.observationCount + samples
             
-        self.observationCount = self.observationCount + 1
+            if self.discover and self.expire is not None:
+                if self.nextexpire is None:
+                    self.nextexpire = ctime
+                if ctime >= self.nextexpire:
+                    self.evict(ctime)
+                    self.nextexpire = ctime + self.expire / 10.0
+            
+            if self.maxrecords is not None and self.records > self.maxrecords:
+                self.shrink()
+        
+        if Metrics.enabled:
+            INGESTED.inc()
             
         for observer in self.observers:
-            observer[2][0] = observer[2][0] - 1
+            observer[2][0] = observer[2][0] - samples
             if observer[2][0] <= 0:
                 observer[2][0] = observer[1]
                 observer[0].notify(self)
     
+    def detect(self,key,detected,ctime,counts=None):
+        """
+            Records the detection of every tag set in the mask 'detected',
+            adding tables for tags which do not have one.  If given, counts
+            maps each tag to its number of detections, otherwise each was
+            detected once.  The caller must hold the manager's lock.
+        """
+        new = detected & ~self.tagmask
+        if not self.discover:
+            new &= self.tracked
+        for tag in Identifiers.members(new):
+            self.tables[tag] = ObservationTable(ctime)
+            if not self.tracked & (1 << tag):
+                Identifiers.tags.hold(tag)
+        self.tagmask |= new
+        self.tracked |= new
+        
+        for tag in Identifiers.members(detected & self.tagmask):
+            weight = 1
+            if counts is not None:
+                weight = counts[tag]
+            self.records += self.tables[tag].update(key,ctime,weight)
+            self.lastseen[tag] = ctime
+    
+    def remove(self,tag):
+        """
+            Removes the table of a tag.  Unless tags are discovered the tag
+            is still tracked, so its table is added again when it is next
+            detected.  The caller must hold the manager's lock.
+        """
+        self.records -= self.tables[tag].size
+        del self.tables[tag]
+        self.lastseen.pop(tag,None)
+        self.tagmask &= ~(1 << tag)
+        if self.discover:
+            self.tracked &= ~(1 << tag)
+            Identifiers.tags.release(tag)
+    
+    def evict(self,ctime):
+        """
+            Removes the tables of the tags not detected within the expiry
+            time of 'ctime'.  Tags which have never been detected are given
+            the expiry time starting from 'ctime'.  The caller must hold the
+            manager's lock.
+        """
+        for tag in self.tables.keys():
+            seen = self.lastseen.get(tag)
+            if seen is None:
+                self.lastseen[tag] = ctime
+            elif seen < ctime - self.expire:
+                self.remove(tag)
+    
+    def shrink(self):
+        """
+            Removes the tables of the tags detected least recently until the
+            number of detection entries held is a tenth below the limit.  The caller
+            must hold the manager's lock.
+        """
+        target = self.maxrecords * 0.9
+        candidates = [(seen,tag) for tag,seen in self.lastseen.items() if self.tables[tag].size > 0]
+        candidates.sort()
+        
+        for seen,tag in candidates:
+            if self.records <= target:
+                break
+            self.remove(tag)
+            if Metrics.enabled:
+                EVICTED.inc()
+    
+    def prune(self):
+        """
+            Removes every observation older than the window from the most
+            recent observation.
+        """
+        with self.lock:
+            expire = self.mostrecent - self.window
+            
+            for records in self.totals.values():
+                records.prune(expire)
+            
+            for table in self.tables.values():
+                self.records -= table.prune(expire)
+    
     def run(self):
         while True:
             time.sleep(self.rate)
-            for tag,table in self.tables.items():
-                table.prune(self.mostrecent)
+            start = Metrics.now()
+            self.prune()
+            if Metrics.enabled:
+                PRUNE.observeSince(start)
     
     def addUpdateListener(self,object,interval):
         self.observers.append( (object,interval,[interval]) )
     
     def get(self,tag,recv,gain):
-        return self.tables[tag].get(recv,gain)
\ No newline at end of file
+        key = (recv,gain)
+        with self.lock:
+            table = self.tables.get(tag,EMPTY)
+            n = key in self.totals and table.total(self.totals[key]) or 0
+            x = table.get(key)
+        return (n,x)
+    
+    def snapshot(self,tags=None):
+        """
+            Returns a Snapshot of the windowed counts of every tag id in
+            'tags' (default all known tags) taken in a single locked operation.
+        """
+        if tags is None:
+            tags = self.tables.keys()
+        
+        with self.lock:
+            counts = dict((tag,self.tables.get(tag,EMPTY).counts(self.totals)) for tag in tags)
+            return Snapshot(counts,observationCount=self.observationCount,
+                                mostrecent=self.mostrecent)
+    
+    def saveState(self,filename):
+        """
+            Writes the observation and detection times of the window to the
+            checkpoint file 'filename'.
+        """
+        with self.lock:
+            recvs = sorted(self.recvlist)
+            index = dict((recv,i) for i,recv in enumerate(recvs))
+            tags = sorted(self.tables.keys())
+            
+            # The Window of each (R,G) key is stored by receiver index and gain
+            times = lambda table: [(index[recv],gain,array("d",records.times),array("L",records.weights))
+                                        for (recv,gain),records in table.items()]
+            
+            state = {"receivers":[Identifiers.receivers.name(recv) for recv in recvs],
+                     "tags":[Identifiers.tags.name(tag) for tag in tags],
+                     "lastseen":[self.lastseen.get(tag) for tag in tags],
+                     "starts":[self.tables[tag].start for tag in tags],
+                     "totals":times(self.totals),
+                     "detections":[times(self.tables[tag].table) for tag in tags],
+                     "observationCount":self.observationCount,
+                     "mostrecent":self.mostrecent,
+                     "window":self.window}
+        
+        WriteCheckpoint(filename,"dynamic",state)
+    
+    def loadState(self,filename):
+        """
+            Replaces the window with that of the checkpoint file 'filename',
+            adding the receivers and tags of the checkpoint the manager does
+            not have.  It should be called before any observation is put into
+            the manager.  Observations outside of this manager's window are
+            pruned.
+        """
+        state = ReadCheckpoint(filename,"dynamic")
+        recvs = [Identifiers.receivers.intern(recv) for recv in state["receivers"]]
+        
+        with self.lock:
+            self.recvlist.update(recvs)
+            self.totals = dict(((recvs[i],gain),Window(times,weights)) for i,gain,times,weights in state["totals"])
+            
+            for name,seen,start,detections in zip(state["tags"],state["lastseen"],state["starts"],
+                                                  state["detections"]):
+                tag = Identifiers.tags.intern(name)
+                if tag in self.tables:
+                    self.records -= self.tables[tag].size
+                
+                table = self.tables[tag] = ObservationTable(start)
+                for i,gain,times,weights in detections:
+                    table.table[(recvs[i],gain)] = Window(times,weights)
+                    table.size += len(times)
+                
+                self.records += table.size
+                self.lastseen[tag] = seen
+                self.tagmask |= 1 << tag
+                if not self.tracked & (1 << tag):
+                    Identifiers.tags.hold(tag)
+                self.tracked |= 1 << tag
+            
+            self.observationCount = state["observationCount"]
+            self.mostrecent = state["mostrecent"]
+        
+        self.prune()
+
+# The table used for tags without one
+EMPTY = ObservationTable()
@@ -0,0 +1,43 @@
+"""
+    This module contains the Snapshot class which is returned by the
+    snapshot() method of every ObservationsManager implementation.
+
+    A snapshot is a frozen copy of the detection counts of a set of tags
+    taken in a single locked operation.  Because the copy is taken all at
+    once every count in the snapshot describes the same instant, and
+    reading from it never touches the locks of the manager it came from.
+"""
+
+class Snapshot(object):
+    """
+        The Snapshot class holds an immutable copy of the (N,X) counts of
+        one or more tags, where N is the number of queries and X the number
+        of detections at each (R,G) cell.  It is read with the same get()
+        method used by the observation managers, except that it never
+        blocks.
+    """
+    def __init__(self,counts,observationCount=0,mostrecent=0):
+        """
+            Constructs a Snapshot instance.
+
+            The counts variable should be a dictionary whose keys are tag ids
+            (see Positioning.Identifiers) and whose values are dictionaries mapping (R,G) to a tuple of
+            (N,X).  The snapshot takes ownership of the dictionaries, so the
+            caller must not keep references to them.
+        """
+        self.__counts = counts
+        self.observationCount = observationCount
+        self.mostrecent = mostrecent
+
+    def tags(self):
+        """
+            Returns the list of tag ids contained in this snapshot.
+        """
+        return self.__counts.keys()
+
+    def get(self,tag,recv,gain):
+        """
+            Returns the (N,X) tuple for the tag id 'tag' at the receiver id
+            'recv' and gain level 'gain'.  Cells which were never observed return (0,0).
+        """
+        return self.__counts[tag].get((recv,gain),(0,0))
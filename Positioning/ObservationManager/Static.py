@@ -8,12 +8,35 @@
     improvement is not known.  The drawback to using this approach is 
     that once observations are stored there is no efficient way to 
     remove them.
+    
+    Receivers and tags are identified by the integer ids assigned by the
+    Positioning.Identifiers module.  The manager can discover receivers and
+    tags it was not given as they are first seen, and forget tags which
+    have not been detected for a while.
+    
+    The counts can be written to a checkpoint file and restored from it,
+    see the Positioning.ObservationManager.Checkpoint module.
+    
+    Observations wait to be applied in a BoundedQueue, whose size and
+    policy are chosen when the manager is constructed.  CountDelta records
+    are applied in a single step, as if each of their observations had
+    been put into the manager.
 """
 from __future__ import with_statement
 from Thesis.constants import known_hosts, known_tags
-from Queue import Queue
+from Positioning.ObservationManager.Snapshot import Snapshot
+from Positioning.ObservationManager.Checkpoint import WriteCheckpoint, ReadCheckpoint
+from Positioning.BoundedQueue import BoundedQueue, BLOCK
+from Positioning import Metrics, Identifiers
+from Queue import Queue, Full
+from array import array
 import threading
 
+INGESTED = Metrics.counter("observations_ingested_total", "Observations put into the manager",
+                            {"manager":"static"})
+APPLIED  = Metrics.counter("observations_applied_total", "Observations applied to the tables",
+                            {"manager":"static"})
+
 class ObservationsTable(object):
     def __init__(self,receivers,gains):
         # Create the table and the individual locks for the rows
@@ -24,12 +47,19 @@ class ObservationsTable(object):
         self.maxrecv = 8
         
         # initialize the values in the table to increase the efficiency of the set methods        
+        self.gains = gains
         for recv in receivers:
-            self.maxrecv = max(self.maxrecv, len(recv))
-            for gain in gains:
-                key = (recv,gain)
-                self.table[key]    = [0,0]
-                self.rowlocks[key] = threading.RLock()
+            self.addReceiver(recv)
+    
+    def addReceiver(self,recv):
+        """
+            Adds the rows of a receiver to the table, with every count zero.
+        """
+        self.maxrecv = max(self.maxrecv, len(Identifiers.receivers.name(recv)))
+        for gain in self.gains:
+            key = (recv,gain)
+            self.table[key]    = [0,0]
+            self.rowlocks[key] = threading.RLock()
                 
     def __str__(self):        
         def hr(): return "+" + "-"*(self.maxrecv+2) + "+" + "-"*6 + ("+" + "-"*7)*2 + "+\n"
@@ -38,7 +68,8 @@ class ObservationsTable(object):
         
         for key in self.table.keys():
             value = self.get(key)
-            strval += "| %s |  %02d  | %05d | %05d |\n" % (key[0],key[1],value[0],value[1])
+            strval += "| %s |  %02d  | %05d | %05d |\n" % (Identifiers.receivers.name(key[0]).ljust(self.maxrecv),
+                                                          key[1],value[0],value[1])
         
         strval += hr()
         return strval
@@ -51,6 +82,14 @@ class ObservationsTable(object):
     def nondetectionEvent(self,key):
         with self.rowlocks[key]:
             self.table[key][0] += 1
+    
+    def countEvent(self,key,n,x):
+        """
+            Adds 'n' queries of which 'x' were detections.
+        """
+        with self.rowlocks[key]:
+            self.table[key][0] += n
+            self.table[key][1] += x
         
     def get(self,key):
         with self.rowlocks[key]:
@@ -58,6 +97,14 @@ class ObservationsTable(object):
         
         return result
     
+    def copy(self):
+        """
+            Returns a copy of the table as a dictionary whose values are
+            (N,X) tuples.  The row locks are not taken so the caller must
+            hold the manager's table lock.
+        """
+        return dict((key,(value[0],value[1])) for key,value in self.table.items())
+    
 class WorkerThread(threading.Thread):
     def __init__(self,manager):
         self.manager = manager
@@ -69,22 +116,37 @@ class WorkerThread(threading.Thread):
         if self.workload is None:
             return
         
-        key = ( self.workload[0], self.workload[1] )
+        key = ( self.workload.recv, self.workload.gain )
+        mask = self.workload.detected
         notdetected = []
         detected = []
         
-        # Go through the expected tags, seeing if they are in the detected ones or not
-        for tagid in self.manager.taglist:
-            if tagid in self.workload[2]:
-                detected.append(tagid)
+        # Call the detection or nondetection event methods, holding the table
+        # lock so that snapshots never see a half applied observation
+        with self.manager.tablelock:
+            if self.manager.discover:
+                self.manager.grow(self.workload)
+            
+            if self.workload.time > self.manager.mostrecent:
+                self.manager.mostrecent = self.workload.time
+            
+            # A CountDelta is applied to every expected tag at once
+            if isinstance(self.workload, Identifiers.CountDelta):
+                samples, counts = self.workload.samples, self.workload.counts
+                for tagid in self.manager.taglist:
+                    self.manager.tables[tagid].countEvent(key,samples,counts.get(tagid,0))
             else:
-                notdetected.append(tagid)  
+                # Go through the expected tags, seeing if their bit is set in the mask
+                for tagid in self.manager.taglist:
+                    if mask >> tagid & 1:
+                        detected.append(tagid)
+                    else:
+                        notdetected.append(tagid)  
                 
-        # Call the detection or nondetection event methods
-        for tag in detected:
-            self.manager.tables[tag].detectionEvent(key)
-        for tag in notdetected:
-            self.manager.tables[tag].nondetectionEvent(key)       
+                for tag in detected:
+                    self.manager.tables[tag].detectionEvent(key)
+                for tag in notdetected:
+                    self.manager.tables[tag].nondetectionEvent(key)       
         
         # Notify the manager of our completion
         self.manager.notify(self)
@@ -98,9 +160,26 @@ class ObservationsManager(threading.Thread):
         level it was detected at.  The value of the tables is the number of
         detections at (R,G) and the total queries at (R,G) 
     """
-    def __init__(self,RecvList=known_hosts.values(),TagList=known_tags.values(),PoolSize=10):
+    def __init__(self,RecvList=known_hosts.values(),TagList=known_tags.values(),PoolSize=10,
+                 discover=False,expire=None,queuesize=10000,policy=BLOCK):
+        """
+            Constructs an ObservationsManager with tables for the receivers
+            of RecvList and the tags of TagList, observations of any other
+            receiver or tag are ignored.
+            
+            If discover is set a receiver or tag seen for the first time is
+            added to the tables instead, its counts start from the
+            observation it was first seen in.  When expire is also given,
+            tags not detected within 'expire' seconds of the most recent
+            observation are removed from the tables, and are added again if
+            they are seen later.
+            
+            At most 'queuesize' observations wait to be applied, see the
+            Positioning.BoundedQueue module for the policies applied when
+            more are put into the manager.
+        """
         # Create the worker queue
-        self.workqueue = Queue()
+        self.workqueue = BoundedQueue(queuesize,policy,name="static-work")
         
         # Create the Thread Pool
         self.workpool = Queue(PoolSize)
@@ -109,36 +188,210 @@ class ObservationsManager(threading.Thread):
             thread.start()
             self.workpool.put( thread )
         
+        # The receivers and tags are kept by their interned ids
+        RecvList = [Identifiers.receivers.intern(recv) for recv in RecvList]
+        TagList  = [Identifiers.tags.intern(tag) for tag in TagList]
+        for tag in TagList:
+            Identifiers.tags.hold(tag)
+        
         # Create the observation tables for each expected tag
         self.tables = dict()
         for tagid in TagList:
             self.tables[tagid] = ObservationsTable(gains=range(32),receivers=RecvList)
             
+        # A lock held while observations are applied to the tables, it allows
+        # a consistent snapshot of every table to be taken at once
+        self.tablelock = threading.RLock()
+        
         # Save off the tag and receiver list for later usage
-        self.recvlist = RecvList
+        self.recvlist = set(RecvList)
         self.taglist = TagList
         
-        # A counter variable
+        # Discovery of new receivers and tags, the mask has the bit of every
+        # tag with a table set and lastseen is the time each tag was last
+        # detected
+        self.discover = discover
+        self.expire = expire
+        self.tagmask = 0
+        for tag in TagList:
+            self.tagmask |= 1 << tag
+        self.lastseen = dict((tag,None) for tag in TagList)
+        self.nextexpire = None
+        
+        # A counter variable and the time of the most recent observation
         self.observationCount = 0
+        self.mostrecent = 0
         
         # A set of callbacks to call after a number of new observations
         self.callbacks = []
         self.notifylock = threading.RLock()
         
+        self.running = True
+        
         # Initialize the thread        
         threading.Thread.__init__(self)
     
     def put(self,reading):
-        if reading[0] in self.recvlist:
+        """
+            Offers an Observation or CountDelta record (see
+            Positioning.Identifiers) to the manager, it is applied by the
+            manager's thread.
+        """
+        if self.discover or reading.recv in self.recvlist:
             self.workqueue.put( reading )
+            if Metrics.enabled:
+                INGESTED.inc()
     
     def get(self,tag,recv,gain):
+        """
+            Returns the [N,X] counts of the tag id 'tag' at the receiver id
+            'recv' and gain level 'gain'.
+        """
         return self.tables[tag].get((recv,gain))
     
+    def snapshot(self,tags=None):
+        """
+            Returns a Snapshot of the counts of every tag id in 'tags'
+            (default all tags) taken in a single locked operation.
+        """
+        if tags is None:
+            tags = self.taglist
+        
+        with self.tablelock:
+            counts = dict((tag,self.tables[tag].copy() if tag in self.tables else dict()) for tag in tags)
+            return Snapshot(counts,observationCount=self.observationCount,
+                                mostrecent=self.mostrecent)
+    
+    def saveState(self,filename):
+        """
+            Writes the counts of every table to the checkpoint file
+            'filename'.  Observations still waiting to be applied are not
+            included.
+        """
+        with self.tablelock:
+            with self.notifylock:
+                recvs = sorted(self.recvlist)
+                keys = [(recv,gain) for recv in recvs for gain in range(32)]
+                
+                # The counts of every tag, receiver and gain in that order
+                counts = array("L")
+                for tag in self.taglist:
+                    table = self.tables[tag].table
+                    for key in keys:
+                        counts.extend(table[key])
+                
+                state = {"receivers":[Identifiers.receivers.name(recv) for recv in recvs],
+                         "tags":[Identifiers.tags.name(tag) for tag in self.taglist],
+                         "lastseen":[self.lastseen.get(tag) for tag in self.taglist],
+                         "counts":counts,
+                         "observationCount":self.observationCount,
+                         "mostrecent":self.mostrecent}
+        
+        WriteCheckpoint(filename,"static",state)
+    
+    def loadState(self,filename):
+        """
+            Replaces the counts of the tables with those of the checkpoint
+            file 'filename', adding tables for the receivers and tags of the
+            checkpoint the manager does not have.  It should be called before
+            any observation is put into the manager.
+        """
+        state = ReadCheckpoint(filename,"static")
+        recvs = [Identifiers.receivers.intern(recv) for recv in state["receivers"]]
+        tags = [Identifiers.tags.intern(tag) for tag in state["tags"]]
+        
+        with self.tablelock:
+            for recv in recvs:
+                if recv not in self.recvlist:
+                    self.recvlist.add(recv)
+                    for table in self.tables.values():
+                        table.addReceiver(recv)
+            
+            counts = iter(state["counts"])
+            for tag,seen in zip(tags,state["lastseen"]):
+                if tag not in self.tables:
+                    self.tables[tag] = ObservationsTable(gains=range(32),receivers=self.recvlist)
+                    self.taglist.append(tag)
+                    self.tagmask |= 1 << tag
+                    Identifiers.tags.hold(tag)
+                self.lastseen[tag] = seen
+                
+                table = self.tables[tag].table
+                for recv in recvs:
+                    for gain in range(32):
+                        table[(recv,gain)] = [counts.next(),counts.next()]
+            
+            with self.notifylock:
+                self.observationCount = state["observationCount"]
+            self.mostrecent = state["mostrecent"]
+    
+    def grow(self,reading):
+        """
+            Adds tables for the receiver and tags of the observation 'reading'
+            which have not been seen before, and removes tags which have
+            expired.  The caller must hold the table lock.
+        """
+        if reading.recv not in self.recvlist:
+            self.recvlist.add(reading.recv)
+            for table in self.tables.values():
+                table.addReceiver(reading.recv)
+        
+        new = reading.detected & ~self.tagmask
+        for tag in Identifiers.members(new):
+            self.tables[tag] = ObservationsTable(gains=range(32),receivers=self.recvlist)
+            self.taglist.append(tag)
+            Identifiers.tags.hold(tag)
+        self.tagmask |= new
+        
+        for tag in Identifiers.members(reading.detected):
+            self.lastseen[tag] = reading.time
+        
+        if self.expire is not None:
+            if self.nextexpire is None:
+                self.nextexpire = reading.time
+            if reading.time >= self.nextexpire:
+                self.evict(reading.time)
+                self.nextexpire = reading.time + self.expire / 10.0
+    
+    def evict(self,ctime):
+        """
+            Removes the tables of the tags not detected within the expiry
+            time of 'ctime'.  Tags which have never been detected are given
+            the expiry time starting from 'ctime'.  The caller must hold the
+            table lock.
+        """
+        for tag in list(self.taglist):
+            seen = self.lastseen.get(tag)
+            if seen is None:
+                self.lastseen[tag] = ctime
+            elif seen < ctime - self.expire:
+                del self.tables[tag]
+                del self.lastseen[tag]
+                self.taglist.remove(tag)
+                self.tagmask &= ~(1 << tag)
+                Identifiers.tags.release(tag)
+    
+    def stop(self):
+        """
+            Stops the manager's thread once it has applied the observation
+            it is working on.  Observations still waiting are not applied,
+            the tables can still be queried.
+        """
+        self.running = False
+        
+        # Wake the thread if it is waiting for work, a full queue means it
+        # is not
+        try:
+            self.workqueue.put(None, False)
+        except Full:
+            pass
+    
     def run(self):
-        while True:
+        while self.running:
             # Block until the next workload is submitted
             work = self.workqueue.get(block=True, timeout=None)
+            if work is None:
+                continue
             
             # Get the next available worker thread
             worker = self.workpool.get(block=True, timeout=None)
@@ -152,10 +405,13 @@ class ObservationsManager(threading.Thread):
             self.callbacks.append((object,interval,[interval]))
         
     def notify(self,worker):
+        if Metrics.enabled:
+            APPLIED.inc()
         with self.notifylock:
-            self.observationCount = self.observationCount + 1
+            samples = worker.workload.samples
+            self.observationCount = self.observationCount + samples
             for i in self.callbacks:
-                i[2][0] = i[2][0] - 1
+                i[2][0] = i[2][0] - samples
                 if i[2][0] <= 0:
                     i[2][0] = i[1]
                     i[0].notify(self)
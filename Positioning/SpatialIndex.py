@@ -0,0 +1,117 @@
+"""
+    This module contains the SpatialIndex class which answers spatial
+    queries over the room positions without scanning every position.
+
+    The index is a uniform grid of square cells laid over the position
+    coordinates, each cell listing the positions inside of it.  A query
+    only looks at the cells its area overlaps, so the cost depends on the
+    number of positions near the query rather than on the size of the
+    room.  The room_index global is an index of the room_positions global
+    from the Thesis.constants module.
+"""
+from Thesis.constants import room_positions
+from math import sqrt, floor
+
+class SpatialIndex():
+    """
+        The SpatialIndex class supports nearest position, radius and
+        bounding box queries over a fixed mapping of position number to XY
+        coordinates.
+    """
+    def __init__(self,positions=room_positions,cellsize=None):
+        """
+            Constructs a SpatialIndex instance for the mapping of position
+            number to XY coordinates 'positions'.
+
+            The cellsize variable is the length of the side of each grid
+            cell.  By default it is chosen so that there is roughly one
+            position per cell.
+        """
+        self.positions = positions
+
+        xs = [x for x,y in positions.values()] or [0.0]
+        ys = [y for x,y in positions.values()] or [0.0]
+        self.xmin, self.ymin = min(xs), min(ys)
+        self.xmax, self.ymax = max(xs), max(ys)
+
+        if cellsize is None:
+            area = max(self.xmax - self.xmin, 1e-9) * max(self.ymax - self.ymin, 1e-9)
+            cellsize = sqrt(area / max(len(positions), 1))
+        self.cellsize = max(cellsize, 1e-9)
+
+        self.cells = dict()
+        for pos,(x,y) in positions.items():
+            self.cells.setdefault(self.__cell(x,y), []).append(pos)
+
+        self.columns = self.__cell(self.xmax,self.ymax)[0] + 1
+        self.rows    = self.__cell(self.xmax,self.ymax)[1] + 1
+
+    def __cell(self,x,y):
+        return (int(floor((x - self.xmin) / self.cellsize)),
+                int(floor((y - self.ymin) / self.cellsize)))
+
+    def __range(self,xmin,ymin,xmax,ymax):
+        """
+            Returns the positions of every cell overlapping the box.
+        """
+        cx1,cy1 = self.__cell(xmin,ymin)
+        cx2,cy2 = self.__cell(xmax,ymax)
+
+        result = []
+        for cx in range(max(cx1,0), min(cx2,self.columns-1) + 1):
+            for cy in range(max(cy1,0), min(cy2,self.rows-1) + 1):
+                result.extend(self.cells.get((cx,cy), ()))
+        return result
+
+    def bbox(self,xmin,ymin,xmax,ymax):
+        """
+            Returns the list of positions inside of the bounding box,
+            including its edges.
+        """
+        return [pos for pos in self.__range(xmin,ymin,xmax,ymax)
+                    if xmin <= self.positions[pos][0] <= xmax
+                   and ymin <= self.positions[pos][1] <= ymax]
+
+    def radius(self,x,y,r):
+        """
+            Returns the list of positions within a distance of 'r' of the
+            point (x,y).
+        """
+        return [pos for pos in self.__range(x-r,y-r,x+r,y+r)
+                    if (self.positions[pos][0]-x)**2 + (self.positions[pos][1]-y)**2 <= r*r]
+
+    def nearest(self,x,y):
+        """
+            Returns the position nearest to the point (x,y), or None if the
+            index is empty.  Rings of cells are searched outwards from the
+            point until no closer position can exist.
+        """
+        if len(self.positions) == 0:
+            return None
+
+        cx,cy = self.__cell(x,y)
+        best, bestdist = None, None
+
+        ring = 0
+        while True:
+            for i in range(cx-ring, cx+ring+1):
+                for j in range(cy-ring, cy+ring+1):
+                    if max(abs(i-cx), abs(j-cy)) != ring:
+                        continue
+                    for pos in self.cells.get((i,j), ()):
+                        px,py = self.positions[pos]
+                        dist = (px-x)**2 + (py-y)**2
+                        if bestdist is None or dist < bestdist:
+                            best, bestdist = pos, dist
+
+            # Every unsearched cell is at least 'ring' cells away from the point
+            if bestdist is not None and sqrt(bestdist) <= ring * self.cellsize:
+                return best
+
+            # Stop once the rings cover every cell of the grid
+            if cx-ring <= 0 and cy-ring <= 0 and cx+ring >= self.columns-1 and cy+ring >= self.rows-1:
+                return best
+
+            ring += 1
+
+room_index = SpatialIndex(room_positions)
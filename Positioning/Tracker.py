@@ -0,0 +1,121 @@
+"""
+    This module contains the Tracker class which keeps a forward filtered
+    belief of where a tag is over time.
+
+    The InferenceEngine infers the likelihood of every position from the
+    observations currently held by the observation manager, but each call
+    is independent of the ones before it.  The Tracker treats the positions
+    as the states of a hidden markov model and combines each new likelihood
+    with its previous belief, moved forward by a transition model based on
+    the distance between positions.  This smooths out noise from small
+    observation windows without giving up responsiveness to real movement.
+"""
+from Thesis.constants import room_positions
+from Positioning.SpatialIndex import SpatialIndex
+from math import exp
+
+class Tracker():
+    """
+        The Tracker class maintains the posterior probability of a tag
+        being at every position.  Call update() with every likelihood
+        returned by the InferenceEngine and read the result back with the
+        position() and posterior() methods.
+    """
+    def __init__(self,positions=room_positions,sigma=2.0,jump=0.01,weight=1.0):
+        """
+            Constructs a Tracker instance.
+
+            The positions variable is a mapping of position number to XY
+            coordinates, the room_positions global is used by default.
+
+            The sigma variable is the standard deviation (in the units of
+            the position coordinates) of the distance a tag is expected to
+            move between two updates.
+
+            The jump variable is the probability of the tag appearing at any
+            position regardless of distance, it allows the tracker to recover
+            when the tag is moved further than expected.
+
+            The weight variable scales the log likelihood before it is
+            applied.  When consecutive likelihoods are inferred from
+            overlapping windows the same observations are counted more than
+            once, a weight of roughly (update interval / window size)
+            compensates for this.
+        """
+        self.positions = positions.keys()
+        self.weight = weight
+        self.jump = jump
+
+        # Build the transition model, the probability of moving from position
+        # i to position j is a gaussian kernel of their distance mixed with a
+        # uniform probability of jumping anywhere.  The kernel is cut off at
+        # four standard deviations, so each row only lists the neighbours
+        # found by the spatial index and the jump is applied in update().
+        index = SpatialIndex(positions)
+        self.transition = dict()
+        for i in self.positions:
+            xi,yi = positions[i]
+            row = dict()
+            for j in index.radius(xi, yi, 4.0*sigma):
+                xj,yj = positions[j]
+                row[j] = exp(-((xi-xj)**2 + (yi-yj)**2) / (2.0*sigma*sigma))
+            total = sum(row.values())
+            for j in row:
+                row[j] = (1.0-jump) * row[j] / total
+            self.transition[i] = row
+
+        self.reset()
+
+    def reset(self):
+        """
+            Forgets all previous updates, the belief becomes uniform over
+            every position.
+        """
+        count = len(self.positions)
+        self.belief = dict((pos,1.0/count) for pos in self.positions)
+        self.updates = 0
+
+    def update(self,likelihood):
+        """
+            Advances the belief by one step and applies the likelihood
+            returned by InferenceEngine.infer().  The likelihood is expected
+            to be a mapping of position to log likelihood, only differences
+            between positions matter.
+
+            Returns the new posterior as a dictionary.
+        """
+        # Predict: move the previous belief forward by the transition model,
+        # the belief sums to one so the jump adds the same to every position
+        prior = dict((pos,self.jump/len(self.positions)) for pos in self.positions)
+        for i in self.positions:
+            b = self.belief[i]
+            for j,p in self.transition[i].items():
+                prior[j] += b * p
+
+        # Correct: weight the prediction by the likelihood, shifting by the
+        # highest value to keep the exponentials from overflowing
+        highest = max(likelihood[pos] for pos in self.positions)
+        posterior = dict()
+        for pos in self.positions:
+            posterior[pos] = prior[pos] * exp(self.weight * (likelihood[pos] - highest))
+
+        total = sum(posterior.values())
+        for pos in self.positions:
+            posterior[pos] /= total
+
+        self.belief = posterior
+        self.updates = self.updates + 1
+        return self.posterior()
+
+    def posterior(self):
+        """
+            Returns a copy of the current belief as a dictionary mapping
+            position to probability.
+        """
+        return dict(self.belief)
+
+    def position(self):
+        """
+            Returns the maximum a posteriori position.
+        """
+        return max(self.positions, key=lambda pos: self.belief[pos])
@@ -0,0 +1,176 @@
+"""
+    This module contains an emulator of the GAO RFID Receivers, used to test
+    the server side of the protocol without any hardware.
+
+    Like the real receivers an EmulatedReceiver connects TO the server (see
+    the Server class of the GAORfidReceiver module) and then answers the
+    commands it is sent using the same BISA_RFID framing:
+        0xA0    Set the mode, no reply
+        0x71    Set the gain, no reply
+        0x72    Get the gain, the gain is returned in the content
+        0x15    Get the data, a 13 byte reading is returned in the buffer for
+                every tag detected
+
+    Whether each tag is detected is decided at random from a detection table
+    mapping each gain level to the probability of detecting each tag, see
+    the DetectionTable function.
+"""
+import struct, threading, time, socket, random, binascii
+
+LOGO = "BISA_RFID\0"
+
+# The 48 byte header of every message: the logo, version, length, command
+# and content
+HEADER = struct.Struct("<10s2sHH32s")
+
+# A single tag reading, a CARD sensor type followed by the 6 byte tag ID
+READING = struct.Struct("<BB6s5x")
+CARD = 0x43
+
+def DetectionTable(cali, recv, placement):
+    """
+        Builds the detection table of an emulated receiver.
+
+        The cali variable is a calibration data dictionary whose keys are
+        (R,G,P) tuples of the receiver, gain and position and whose values
+        are the probability of detection.  The recv variable is the receiver
+        of the calibration data to emulate and the placement variable is a
+        dictionary mapping each tag ID to its position.
+
+        Returns a dictionary mapping each gain level to a list of tuples of
+        the packed tag reading and its probability of detection.
+    """
+    table = dict()
+    for gain in range(32):
+        table[gain] = []
+        for tag,pos in placement.items():
+            p = cali.get((recv,gain,pos), 0.0)
+            if p > 0:
+                table[gain].append( (READING.pack(CARD, 0, binascii.unhexlify(tag)), p) )
+    return table
+
+class EmulatedReceiver(threading.Thread):
+    """
+        The EmulatedReceiver class connects to a server as if it were a GAO
+        RFID Receiver and answers its commands until stop() is called.  If
+        the connection is lost the receiver connects again.
+    """
+    def __init__(self, table, server=("127.0.0.1",8900), bind=None, latency=0.0, jitter=0.0,
+                 droprate=0.0, reconnect=1.0, seed=None):
+        """
+            Constructs an EmulatedReceiver instance.
+
+            The table variable is the detection table returned by the
+            DetectionTable function.  The server variable is the (host, port)
+            address to connect to, and if the bind variable is given the
+            connection is made from that local address so the server sees a
+            different receiver address (such as 127.0.0.2 or 127.0.0.3).
+
+            Every reply is delayed by 'latency' seconds plus a random amount
+            of up to 'jitter' seconds.  Each request is dropped with the
+            probability 'droprate', a dropped request is never answered and
+            the connection is closed, as if the receiver had lost power.  The
+            receiver reconnects 'reconnect' seconds after a connection ends.
+        """
+        self.table = table
+        self.server = server
+        self.bind = bind
+        self.latency = latency
+        self.jitter = jitter
+        self.droprate = droprate
+        self.reconnect = reconnect
+        self.random = random.Random(seed)
+
+        self.gain = 0
+        self.mode = 1
+        self.sock = None
+        self.running = True
+
+        # Counters which can be read while the receiver runs
+        self.requests = 0
+        self.drops = 0
+        self.connections = 0
+
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+
+    def run(self):
+        while self.running:
+            try:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                if self.bind:
+                    self.sock.bind((self.bind,0))
+                self.sock.connect(self.server)
+                self.connections += 1
+                self.serve()
+            except socket.error:
+                pass
+
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+
+            if self.running:
+                time.sleep(self.reconnect)
+
+    def receive(self, length):
+        """
+            Reads exactly 'length' bytes, returning None if the connection
+            was closed first.
+        """
+        data = ""
+        while len(data) < length:
+            chunk = self.sock.recv(length - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def serve(self):
+        """
+            Answers commands until the connection is closed or a request is
+            dropped.
+        """
+        while self.running:
+            message = self.receive(HEADER.size)
+            if message is None:
+                return
+
+            logo, version, length, command, content = HEADER.unpack(message)
+            if length > HEADER.size and self.receive(length - HEADER.size) is None:
+                return
+
+            buf = ""
+            if command == 0xA0:
+                self.mode = ord(content[0])
+                continue
+            elif command == 0x71:
+                self.gain = ord(content[1])
+                continue
+            elif command == 0x72:
+                content = struct.pack("BB", 0, self.gain)
+            elif command == 0x15:
+                content = ""
+                buf = "".join(reading for reading,p in self.table.get(self.gain, ())
+                                if self.random.random() < p)
+            else:
+                continue
+
+            self.requests += 1
+            if self.droprate > 0 and self.random.random() < self.droprate:
+                self.drops += 1
+                return
+
+            if self.latency > 0 or self.jitter > 0:
+                time.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+            self.sock.sendall(HEADER.pack(LOGO, version, HEADER.size + len(buf), command, content) + buf)
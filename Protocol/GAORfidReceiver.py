@@ -2,10 +2,41 @@
     This module contains the classes and functions to handle the protocol used
     by the GAO RFID Receivers . 
 """
-import struct, threading, time, socket
+import struct, threading, time, socket, binascii
 
 SENSOR_TYPE = {0x43: 'CARD', 0xBB: 'TEMP', 0xCC: 'VIBR'}
 
+# A single 13 byte tag reading: the sensor type, a status byte and the tag
+# ID (the first 4 bytes of which are the ID of a TEMP sensor)
+READING = struct.Struct("BB6s5x")
+
+# The tag ID strings of every raw tag ID seen, so that each tag's ID string
+# is only formatted once
+TAG_IDS = dict()
+
+def ParseTagIds(buf):
+    """
+        Parses the IDs of the detected tags from the data buffer returned by
+        the 0x15 (get data) command, without building a dictionary for each
+        reading.  The IDs are the same as the 'id' values returned by the
+        Connection.parseReadings() method.
+    """
+    unpack = READING.unpack_from
+    result = []
+    for offset in xrange(0, len(buf) - len(buf) % READING.size, READING.size):
+        sensor, status, raw = unpack(buf, offset)
+        
+        if sensor == 0xBB:
+            raw = raw[:4]
+        elif sensor != 0x43 and sensor != 0xCC:
+            raw = ""
+        
+        id = TAG_IDS.get(raw)
+        if id is None:
+            id = TAG_IDS.setdefault(raw, intern(binascii.hexlify(raw)))
+        result.append(id)
+    return result
+
 class Connection(object):
     """
         The Connection class handles TCP/IP communication between the server and the
@@ -135,6 +166,21 @@ class Connection(object):
         
         return self.parseReadings(result['buf'])
     
+    def getTagIds(self):
+        """
+            This function is the same as getData() but only returns the list
+            of the IDs of the detected tags, which is much faster to parse.
+        """
+        self.lock.acquire(True)
+        
+        self.send(length=48, command=0x15)
+        time.sleep(0.001)
+        result = self.parseMessage()
+        
+        self.lock.release()
+        
+        return ParseTagIds(result['buf'])
+    
     def parseMessage(self):
         """
             This function receives a response structure from the socket and parses it.
@@ -4,16 +4,91 @@
     utilized.
 """
 from matplotlib.mlab import griddata
+from matplotlib.tri import Triangulation
 import numpy, pylab, time
 
+class InterpolationBasis(object):
+    """
+        The InterpolationBasis class precomputes the linear interpolation of
+        a fixed set of XY points onto a regular grid.  The points are
+        triangulated once and every grid node is assigned the barycentric
+        weights of the three corners of the triangle containing it.  The
+        interpolation is then a sparse matrix product with exactly three
+        non-zero weights per grid node, which is far cheaper than calling
+        griddata (and triangulating the points again) for every plot.
+    """
+    def __init__(self, x, y, xi, yi):
+        """
+            Constructs an InterpolationBasis for the points whose coordinates
+            are given by the sequences x and y onto the grid defined by the
+            vectors xi and yi.  The points must stay in the same order for
+            every call to apply().
+        """
+        self.x  = numpy.asarray(x, dtype=float)
+        self.y  = numpy.asarray(y, dtype=float)
+        self.xi = numpy.asarray(xi, dtype=float)
+        self.yi = numpy.asarray(yi, dtype=float)
+        self.shape = (len(self.yi), len(self.xi))
+        
+        # Remember the index of every point so values can be given by coordinate
+        self.index = dict(((px,py),i) for i,(px,py) in enumerate(zip(self.x, self.y)))
+        
+        # Triangulate the points and find the triangle containing each grid node
+        tri = Triangulation(self.x, self.y)
+        gx, gy = numpy.meshgrid(self.xi, self.yi)
+        gx = gx.ravel()
+        gy = gy.ravel()
+        found = tri.get_trifinder()(gx, gy)
+        
+        # Grid nodes outside of the convex hull of the points are masked
+        self.mask = found < 0
+        corners = tri.triangles[numpy.where(self.mask, 0, found)]
+        
+        # Calculate the barycentric weights of the three corners of each triangle
+        xa, xb, xc = [self.x[corners[:,i]] for i in range(3)]
+        ya, yb, yc = [self.y[corners[:,i]] for i in range(3)]
+        det = (yb - yc)*(xa - xc) + (xc - xb)*(ya - yc)
+        wa  = ((yb - yc)*(gx - xc) + (xc - xb)*(gy - yc)) / det
+        wb  = ((yc - ya)*(gx - xc) + (xa - xc)*(gy - yc)) / det
+        
+        self.indices = corners
+        self.weights = numpy.column_stack((wa, wb, 1.0 - wa - wb))
+        self.weights[self.mask] = 0.0
+    
+    def apply(self, z):
+        """
+            Interpolates the values z, one per point in the order given at
+            construction, onto the grid.  Returns a masked array with one row
+            per value of yi and one column per value of xi like griddata.
+        """
+        z  = numpy.asarray(z, dtype=float)
+        zi = (self.weights * z[self.indices]).sum(axis=1)
+        return numpy.ma.array(zi.reshape(self.shape), mask=self.mask.reshape(self.shape))
+    
+    def applyPoints(self, points):
+        """
+            Interpolates a list of tuples of length 3 onto the grid.  Every
+            point must be one of the points given at construction, points
+            which are not given take a value of zero.
+        """
+        z = numpy.zeros(len(self.x))
+        for pt in points:
+            z[self.index[(pt[0],pt[1])]] = pt[2]
+        return self.apply(z)
+
 def contour(points, title="Untitled Plot", xlabel="Untitled X-Axis", ylabel="Untitled Y-Axis",
             legend=True, xrange=(0,100), yrange=(0,100), figure_number=None, include_bounds=True,
-            filled=True):
+            filled=True, basis=None):
     """
         This helper function creates a pylab figure for a contour plot from a 
         list of tuples of length 3.  This function returns the figure number 
         for the pylab figure.  To handle replotting set the figure_number to 
         the number returned by your original plotting function. 
+        
+        If an InterpolationBasis is given as 'basis' it is used in place of
+        griddata, it must have been built from the same XY points (including
+        the range points when include_bounds is set) onto a 100x100 grid
+        over the given ranges.
     """
     
     # Create a figure or set it to the active figure
@@ -48,7 +123,10 @@ def contour(points, title="Untitled Plot", xlabel="Untitled X-Axis", ylabel="Unt
     # Use linear interpolation on the points to get a normal grid
     xi = numpy.linspace(xrange[0], xrange[1], 100)
     yi = numpy.linspace(yrange[0], yrange[1], 100)
-    zi = griddata(x,y,z,xi,yi)
+    if basis is None:
+        zi = griddata(x,y,z,xi,yi)
+    else:
+        zi = basis.applyPoints(zip(x,y,z))
     
     # Draw a filled contour plot
     if filled:
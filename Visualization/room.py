@@ -1,11 +1,37 @@
 """
     This module contains helper functions specific to this thesis.  The
-    only function of note is the RoomContour function, which makes a
-    contour plot of the room, showing the geometry and contours of each
-    point defined.
+    functions of note are the RoomContour function, which makes a contour
+    plot of the room, showing the geometry and contours of each point
+    defined, and the RoomRenderer class which draws the same plot
+    repeatedly while only redrawing the contours.
 """
 from Thesis.constants import room_positions, room_geometry, room_dimensions
-from Visualization.helpers import contour
+from Visualization.helpers import contour, InterpolationBasis
+from Positioning.SpatialIndex import SpatialIndex, room_index
+from matplotlib.colorbar import make_axes
+import numpy, pylab
+
+# Interpolation bases are expensive to build but the point layout rarely
+# changes between plots, so they are cached by the set of XY points used
+_basis_cache = dict()
+
+def ContourBasis(points, xrange, yrange):
+    """
+        Returns an InterpolationBasis for the XY components of the given 3D
+        points onto the 100x100 grid used by the contour() helper function.
+        Bases are cached, so asking again for the same layout is cheap.
+    """
+    xy  = frozenset((pt[0],pt[1]) for pt in points)
+    key = (xy, tuple(xrange), tuple(yrange))
+    
+    if key not in _basis_cache:
+        x = [pt[0] for pt in xy]
+        y = [pt[1] for pt in xy]
+        xi = numpy.linspace(xrange[0], xrange[1], 100)
+        yi = numpy.linspace(yrange[0], yrange[1], 100)
+        _basis_cache[key] = InterpolationBasis(x, y, xi, yi)
+    
+    return _basis_cache[key]
 
 def PointLine(p1,p2,zval=0.0,step=0.1):
     """
@@ -75,7 +101,8 @@ def RoomContour(posdata,geopoints,**kwargs):
         from the Thesis.constants module to get the XY values of each position.
         
         For details about the drawing method used consult the contour() function 
-        defined in the Visualization.helpers module.
+        defined in the Visualization.helpers module.  The interpolation basis
+        of the points is built on the first call and reused afterwards.
         
         The figure number used by pylab will be returned by this function.
     """
@@ -102,6 +129,147 @@ def RoomContour(posdata,geopoints,**kwargs):
     range_x = (0.0, room_dimensions[0])
     range_y = (0.0, room_dimensions[1]) 
     
+    # the layout of the points is the same for every plot so reuse its interpolation basis
+    basis = ContourBasis(allpoints, range_x, range_y)
+    
     # return the figure number, returned by the contour plot function
-    return contour(allpoints, xrange=range_x, yrange=range_y, include_bounds=False, **kwargs)
+    return contour(allpoints, xrange=range_x, yrange=range_y, include_bounds=False, basis=basis, **kwargs)
+    
+
+class RoomRenderer(object):
+    """
+        The RoomRenderer class draws contour plots of the room for a stream of
+        position values, such as the likelihoods returned by the
+        InferenceEngine, much faster than repeated calls to RoomContour.
+        
+        The walls are drawn once as line artists, the interpolation basis of
+        the fixed position layout is built once, and each call to draw() only
+        replaces the contour artists.  Only the positions and the four corners
+        of the room or region (with a value of zero) are interpolated, the room geometry
+        is not rasterised into points.
+        
+        A headless renderer draws onto an Agg canvas without touching pylab,
+        so it can write PNG files without a display.
+        
+        A renderer can be limited to a region of the room, only the positions
+        inside of the region are interpolated and drawn.
+    """
+    def __init__(self, filled=True, legend=False, headless=False, figure_number=1,
+                 levels=15, positions=room_positions, axes=None, region=None):
+        """
+            Constructs a RoomRenderer.  The filled, legend and figure_number
+            variables have the same meaning as in the contour() helper
+            function, the levels variable is the number of contour levels.
+            
+            If headless is set the figure is not shown, use the save() method
+            to write it to a file.
+            
+            If an existing matplotlib axes is given the room is drawn into it
+            rather than into a new figure, which allows several rooms to be
+            tiled on one figure.  The figure is then never drawn on screen by
+            the renderer.
+            
+            The region variable is a bounding box (xmin, ymin, xmax, ymax) in
+            the coordinates of room_positions to draw, by default the whole
+            room is drawn.
+        """
+        self.filled = filled
+        self.legend = legend
+        self.headless = headless
+        self.levels = levels
+        
+        width, height = room_dimensions
+        
+        # Find the positions inside of the region with the spatial index
+        if region is None:
+            region = (0.0, 0.0, width, height)
+        xmin, ymin, xmax, ymax = region
+        
+        index = room_index if positions is room_positions else SpatialIndex(positions)
+        self.positions = index.bbox(xmin, ymin, xmax, ymax)
+        
+        # Create the figure, either on an offscreen canvas or through pylab
+        if axes is not None:
+            self.headless = True
+            self.figure = axes.figure
+        elif headless:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            self.figure = Figure()
+            FigureCanvasAgg(self.figure)
+        else:
+            pylab.ion()
+            self.figure = pylab.figure(figure_number)
+            pylab.ioff()
+            self.figure.clf()
+        self.axes = axes or self.figure.add_subplot(111)
+        
+        # Draw the room geometry once as lines, the Y values must be relative
+        # to the bottom of the room rather than the top
+        for (x1,y1),(x2,y2) in room_geometry:
+            self.axes.plot([x1,x2], [height-y1,height-y2], color='black', linewidth=2)
+        
+        # Mark the positions, these never move
+        x = [positions[pos][0] for pos in self.positions]
+        y = [height - positions[pos][1] for pos in self.positions]
+        self.axes.scatter(x, y, marker='o', c='black', s=20, zorder=3)
+        self.marker, = self.axes.plot([], [], marker='x', color='white',
+                                      markersize=12, markeredgewidth=3, zorder=4)
+        
+        self.axes.set_xlim(xmin, xmax)
+        self.axes.set_ylim(height-ymax, height-ymin)
+        
+        # Get the interpolation basis for the positions and the region corners,
+        # it is shared by every renderer of the same layout
+        self.points = zip(x + [xmin, xmax, xmin, xmax],
+                          y + [height-ymax, height-ymax, height-ymin, height-ymin])
+        self.basis = ContourBasis(self.points, (xmin, xmax), (height-ymax, height-ymin))
+        self.xi = self.basis.xi
+        self.yi = self.basis.yi
+        
+        # Reserve the space for the colour bar once
+        if legend:
+            self.colorbar, kwargs = make_axes(self.axes)
+        
+        self.contours = None
+    
+    def draw(self, posdata, title="", estimate=None):
+        """
+            Draws the contours for the values in posdata, a mapping of the
+            position number to the contour value.  Positions not defined in
+            posdata use a value of zero.
+            
+            If an (x,y) estimate in the coordinates of room_positions is given
+            it is marked on the plot.
+        """
+        z  = [posdata.get(pos, 0.0) for pos in self.positions] + [0.0]*4
+        zi = self.basis.applyPoints((x,y,zval) for (x,y),zval in zip(self.points, z))
+        
+        # Replace the previous contours
+        if self.contours is not None:
+            for artist in self.contours.collections:
+                artist.remove()
+        
+        if self.filled:
+            self.contours = self.axes.contourf(self.xi, self.yi, zi, self.levels, cmap=pylab.cm.jet)
+        else:
+            self.contours = self.axes.contour(self.xi, self.yi, zi, self.levels, cmap=pylab.cm.gray)
+        
+        # The levels change every frame so the colour bar must be redrawn as well
+        if self.legend:
+            self.colorbar.cla()
+            self.figure.colorbar(self.contours, cax=self.colorbar)
+        
+        if estimate is not None:
+            self.marker.set_data([estimate[0]], [room_dimensions[1] - estimate[1]])
+        
+        self.axes.set_title(title)
+        
+        if not self.headless:
+            self.figure.canvas.draw()
     
+    def save(self, filename):
+        """
+            Writes the figure as it was last drawn to the file 'filename'.
+        """
+        self.figure.savefig(filename)
@@ -1,7 +1,12 @@
 """
     This script visualizes calibration data as a contour plot and writes the 
-    output to a PNG file.  The contour plot will include points to 
-    approximate the room's geometry.
+    output to a PNG file.  The contour plot will include the lines of the
+    room's geometry.
+
+    Frames are drawn offscreen and spread across a pool of processes, each
+    process reusing the same room geometry and interpolation basis for
+    every frame it draws.  An atlas sheet draws the room geometry once for
+    each of its tiles, which share the cached interpolation basis.
     
     Command Line Options:
         --receiver            Specifies a specific receiver to visualize.
@@ -20,14 +25,67 @@
         --vis-prefix          When writing to PNG files prepend this to the
                               filenames.
                               Default: None    
+
+        --atlas               Write a single tiled sheet for each receiver
+                              showing every gain, rather than one file per
+                              receiver and gain.
+
+        --processes           The number of processes to render with.
+                              Default: The number of CPUs
 """
-from Visualization.room import RoomContour, GeometryPoints
+import matplotlib
+matplotlib.use("Agg")
+
+from Positioning.DataSource.CalibrationFile import ParseCalibrationFile
+from Visualization.room import RoomRenderer
 from Thesis.constants import *
 
-from itertools import izip
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from multiprocessing import Pool, cpu_count
 from getopt import getopt
 
-import sys, time, pylab
+import sys, time
+
+# Every process keeps its own renderer so the room geometry and the
+# interpolation basis are only built once per process
+renderer = None
+
+def initialize(filled, legend):
+    global renderer
+    renderer = RoomRenderer(filled=filled, legend=legend, headless=True)
+
+def render(job):
+    """
+        Draws a single (receiver, gain) frame and writes it to a file.
+    """
+    filename, recv, gain, values = job
+
+    plotTitle = "Calibration Data for %s at gain %d" % (recv,gain)
+    renderer.draw(values, title=plotTitle)
+    renderer.save(filename)
+    return filename
+
+def atlas(job):
+    """
+        Draws every gain of a receiver tiled onto a single sheet and writes
+        it to a file.
+    """
+    filename, recv, frames, filled, legend = job
+
+    columns = 8
+    rows    = (len(frames) + columns - 1) / columns
+
+    figure = Figure(figsize=(3*columns, 4*rows))
+    FigureCanvasAgg(figure)
+
+    for i,(gain,values) in enumerate(frames):
+        axes = figure.add_subplot(rows, columns, i+1)
+        RoomRenderer(filled=filled, legend=legend, axes=axes).draw(values, title="Gain %d" % gain)
+
+    figure.suptitle("Calibration Data for %s" % recv)
+    figure.savefig(filename)
+    return filename
 
 if __name__ == "__main__":
     
@@ -37,11 +95,13 @@ if __name__ == "__main__":
         print "Usage: %s " % (sys.argv[0])
         print "\t<--calibration-file=FILE> [--receiver=ALIAS|IP] [--gain=INT]"
         print "\t[--legend] [--vis-prefix=STRING] [--filled]"
+        print "\t[--atlas] [--processes=INT]"
         sys.exit(1)
     
     ## Start by parsing the command line arguments
     ##-------------------------------------------------------------------------
-    options = ["calibration-file=","receiver=","gain=","legend","vis-prefix=","filled"]
+    options = ["calibration-file=","receiver=","gain=","legend","vis-prefix=","filled",
+               "atlas","processes="]
     
     optlist, args = getopt(sys.argv[1:], '', options)
     optlist = dict(optlist)
@@ -50,7 +110,9 @@ if __name__ == "__main__":
     Receiver        = optlist.get("--receiver")
     Gain            = int(optlist.get("--gain","-1"))
     UseLegend       = optlist.has_key("--legend")
-    FilledContour   = optlist.has_key("filled")
+    FilledContour   = optlist.has_key("--filled")
+    Atlas           = optlist.has_key("--atlas")
+    Processes       = int(optlist.get("--processes", cpu_count()))
     
     DumpPrefix      = optlist.get("--vis-prefix","")
     
@@ -61,19 +123,7 @@ if __name__ == "__main__":
     
     ##########
     
-    argmax = lambda array: max(izip(array, xrange(len(array))))[1]
-    
-    CalibrationFile = open(CalibrationFile, "r")
-    CalibrationData = dict()
-    
-    try:
-        for line in CalibrationFile:
-            (host,t,g,n,p,x) = line.split(",")
-            t,g,n,p,x = (float(t),int(g),int(n),int(p),int(x))
-        
-            CalibrationData[(host,g,p)] = float(x)/float(n)
-    finally:
-        CalibrationFile.close()
+    CalibrationData = ParseCalibrationFile(CalibrationFile)
     
     # Determine which receivers to iterate through, depending on command line args
     recvs = known_hosts.values()
@@ -85,21 +135,37 @@ if __name__ == "__main__":
     if Gain >= 0:
         gains = [ Gain ]
     
-    # Pre-calculate the geometry points
-    geodata = GeometryPoints(0.25)
-    
-    # Go through every receiver and every gain
-    for gain in gains:
-        for recv in recvs:
-    
-            # Get tuples for each position
-            values = dict()
-            for pos in room_positions.keys():
-                values[pos] = CalibrationData.get((recv,gain,pos))
-            
-            # Create the plot and save it
-            plotTitle = "Calibration Data for %s at gain %d" % (recv,gain)
-            RoomContour(values,geodata,figure_number=1,title=plotTitle,xlabel="",ylabel="",legend=UseLegend,filled=FilledContour)
+    # Get the values of each position for a receiver and gain
+    def values(recv,gain):
+        result = dict()
+        for pos in room_positions.keys():
+            p = CalibrationData.get((recv,gain,pos))
+            if p is not None:
+                result[pos] = p
+        return result
+    
+    # Build the list of files to draw, either a sheet per receiver or a file
+    # for every receiver and gain
+    if Atlas:
+        # Each tile of a sheet needs its own axes, so no renderer is shared
+        function, initializer = atlas, None
+        jobs = [("%s%s.png" % (DumpPrefix, recv), recv, [(g,values(recv,g)) for g in sorted(gains)],
+                    FilledContour, UseLegend) for recv in recvs]
+    else:
+        function, initializer = render, initialize
+        jobs = [("%s%s-G%0.2d.png" % (DumpPrefix, recv, gain), recv, gain, values(recv,gain))
+                    for gain in gains for recv in recvs]
+    
+    # Draw everything, in parallel if more than one process is used
+    if Processes > 1:
+        pool = Pool(Processes, initializer, (FilledContour, UseLegend))
+        for filename in pool.imap_unordered(function, jobs):
+            print "INFO: Wrote %s" % filename
+        pool.close()
+        pool.join()
+    else:
+        if initializer is not None:
+            initializer(FilledContour, UseLegend)
+        for job in jobs:
+            print "INFO: Wrote %s" % function(job)
             
-            pylab.savefig( "%s%s-G%0.2d.png" % (DumpPrefix, recv, gain) )
-    
\ No newline at end of file
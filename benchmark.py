@@ -0,0 +1,305 @@
+"""
+    This script benchmarks the hot paths of the positioning system so that
+    changes to them can be compared against each other.  Every benchmark is
+    repeated and the best and mean times are recorded.
+
+    The benchmarks are:
+        calibration-load      Parsing each calibration file.
+
+        dump-read             Parsing an observation dump file with the
+                              DumpFileReader.
+
+        ingest-static         Putting every observation of a dump into the
+        ingest-dynamic        Static or Dynamic observation manager.
+
+        infer-n               InferenceEngine.infer() latency against the
+                              number of observations held.
+
+        infer-window          InferenceEngine.infer() latency against the
+                              window size of the Dynamic manager.
+
+        infer-positions       InferenceEngine.infer() latency against the
+                              number of positions inferred.
+
+        parse-tag-ids         Parsing the tag IDs of a receiver's data
+                              buffer against the number of readings.
+
+    The observation file and synthetic dump files of each size given by
+    --synthetic are all run through the dump-read and ingest benchmarks.
+    Synthetic dumps are sampled from the first calibration file, with every
+    known tag placed at a random position.
+
+    Command Line Options:
+        --observation-file    The observation file to replay, a comma
+                              separated or binary observation dump file
+                              such as those written by generate.py.
+                              Default: 04.obs
+
+        --calibration-file    A comma separated list of calibration files.
+                              The first is used for inference.
+                              Default: TagE.cali,TagF.cali
+
+        --synthetic           A comma separated list of the number of
+                              observations in each synthetic dump.
+                              Default: None
+
+        --repeat              The number of times each benchmark is run.
+                              Default: 3
+
+        --output              Write the results to this file as JSON.
+                              Default: None
+
+        --compare             A results file from a previous run.  Every
+                              benchmark more than --tolerance slower than
+                              in that file is reported, and the script
+                              exits with a status of 1.
+
+        --tolerance           The fraction a benchmark may slow down by
+                              before it is reported by --compare.
+                              Default: 0.1
+"""
+from Positioning.DataSource.CalibrationFile import ParseCalibrationFile
+from Positioning.DataSource.DumpFile import DumpFileReader, DumpFileWriter
+from Positioning.DataSource.BinaryDumpFile import BinaryDumpFileReader, IsBinaryDumpFile
+from Positioning.ObservationManager import Dynamic, Static
+from Positioning.InferenceEngine import InferenceEngine
+from Protocol.GAORfidReceiver import ParseTagIds, READING
+from Thesis.constants import known_hosts, known_tags, room_positions
+from timeit import default_timer
+from getopt import getopt
+
+import sys, os, time, random, tempfile, platform, json, binascii
+
+class ListQueue(object):
+    """
+        A queue which collects every observation offered to it.
+    """
+    def __init__(self):
+        self.items = []
+
+    def put(self,item):
+        self.items.append(item)
+
+def measure(function,repeat):
+    """
+        Calls 'function' 'repeat' times and returns the best and mean time
+        in seconds together with the result of the last call.
+    """
+    times = []
+    for i in range(repeat):
+        start = default_timer()
+        result = function()
+        times.append(default_timer() - start)
+    return min(times), sum(times) / len(times), result
+
+def ReadDump(filename):
+    queue = ListQueue()
+    if IsBinaryDumpFile(filename):
+        BinaryDumpFileReader(queue, filename).run()
+    else:
+        DumpFileReader(queue, filename).run()
+    return queue.items
+
+def IngestStatic(observations):
+    manager = Static.ObservationsManager()
+    manager.setDaemon(True)
+    manager.start()
+
+    expected = sum(obs.samples for obs in observations if obs.recv in manager.recvlist)
+    for obs in observations:
+        manager.put(obs)
+
+    # The static manager applies observations on its own thread, which is
+    # stopped so repeats do not leave idle managers behind
+    while manager.observationCount < expected:
+        time.sleep(0.001)
+    manager.stop()
+    return manager
+
+def IngestDynamic(observations,window=sys.maxint):
+    manager = Dynamic.ObservationsManager(window)
+    for obs in observations:
+        manager.put(obs)
+
+    # Prune once, as the manager's own thread would
+    manager.prune()
+    return manager
+
+def WriteSynthetic(filename,count,cali):
+    """
+        Writes a dump file of 'count' observations sampled from the
+        calibration data, with every known tag at a random position.
+    """
+    rand = random.Random(count)
+    placement = dict((tag,rand.choice(room_positions.keys())) for tag in known_tags.values())
+
+    writer = DumpFileWriter(filename)
+    writer.open()
+    try:
+        ctime = 0.0
+        while True:
+            for gain in range(32):
+                for recv in known_hosts.values():
+                    if count == 0:
+                        return
+                    detected = [tag for tag,pos in placement.items()
+                                    if rand.random() < cali.get((recv,gain,pos),0.0)]
+                    writer.writeObservation((recv,gain,detected,ctime))
+                    ctime += 1.0
+                    count -= 1
+    finally:
+        writer.close()
+
+def InferAll(engine,positions=None):
+    for tag in known_tags.values():
+        engine.infer(tag, positions)
+
+if __name__ == '__main__':
+    ## A function to print usage
+    ##-------------------------------------------------------------------------
+    def usage(error):
+        print "Error: %s\n" % error
+        print "Usage: %s " % (sys.argv[0])
+        print "\t[--observation-file=FILE] [--calibration-file=FILE[,FILE ...]]"
+        print "\t[--synthetic=INT[,INT ...]] [--repeat=INT] [--output=FILE]"
+        print "\t[--compare=FILE] [--tolerance=FLOAT]"
+        sys.exit(1)
+
+    ## Start by parsing the command line arguments
+    ##-------------------------------------------------------------------------
+    options = [
+        "observation-file=","calibration-file=","synthetic=","repeat=",
+        "output=","compare=","tolerance="
+        ]
+
+    optlist, args = getopt(sys.argv[1:], '', options)
+    optlist = dict(optlist)
+
+    ObservationFile  = optlist.get("--observation-file", "04.obs")
+    CalibrationFiles = optlist.get("--calibration-file", "TagE.cali,TagF.cali").split(",")
+    Synthetic        = [int(x) for x in optlist.get("--synthetic", "").split(",") if x]
+    Repeat           = int(optlist.get("--repeat", 3))
+    OutputFile       = optlist.get("--output")
+    CompareFile      = optlist.get("--compare")
+    Tolerance        = float(optlist.get("--tolerance", 0.1))
+
+    if Repeat < 1:
+        usage("The repeat count must be at least one.")
+
+    results = []
+    def record(benchmark, params, best, mean, count=None):
+        result = {"benchmark":benchmark, "params":params, "best":best, "mean":mean}
+        if count is not None:
+            result["count"] = count
+            result["rate"] = count / best if best > 0 else 0.0
+        results.append(result)
+
+        line = "%-18s %-40s best=%.4fs mean=%.4fs" % (benchmark, json.dumps(params, sort_keys=True), best, mean)
+        if count is not None:
+            line += " rate=%.0f/s" % result["rate"]
+        print line
+
+    ## Calibration file loading
+    ##-------------------------------------------------------------------------
+    for filename in CalibrationFiles:
+        best, mean, cali = measure(lambda: ParseCalibrationFile(filename), Repeat)
+        record("calibration-load", {"file":filename}, best, mean, len(cali))
+
+    CaliData = ParseCalibrationFile(CalibrationFiles[0])
+
+    ## Dump reading and ingest, for the observation file and synthetic dumps
+    ##-------------------------------------------------------------------------
+    dumps = [(ObservationFile, ObservationFile)]
+    tempfiles = []
+    for count in Synthetic:
+        handle, filename = tempfile.mkstemp(suffix=".obs")
+        os.close(handle)
+        WriteSynthetic(filename, count, CaliData)
+        tempfiles.append(filename)
+        dumps.append(("synthetic-%d" % count, filename))
+
+    try:
+        for name, filename in dumps:
+            best, mean, observations = measure(lambda: ReadDump(filename), Repeat)
+            record("dump-read", {"dump":name}, best, mean, len(observations))
+
+            best, mean, manager = measure(lambda: IngestStatic(observations), Repeat)
+            record("ingest-static", {"dump":name}, best, mean, len(observations))
+
+            best, mean, manager = measure(lambda: IngestDynamic(observations), Repeat)
+            record("ingest-dynamic", {"dump":name}, best, mean, len(observations))
+    finally:
+        for filename in tempfiles:
+            os.remove(filename)
+
+    ## Inference latency, every known tag is inferred once per run
+    ##-------------------------------------------------------------------------
+    observations = ReadDump(ObservationFile)
+    tags = len(known_tags)
+
+    # Against the number of observations held
+    sizes = sorted(set([n for n in (100, 1000, 5000) if n < len(observations)] + [len(observations)]))
+    for n in sizes:
+        engine = InferenceEngine(IngestDynamic(observations[:n]), CaliData)
+        best, mean, result = measure(lambda: InferAll(engine), Repeat)
+        record("infer-n", {"n":n}, best / tags, mean / tags)
+
+    # Against the window size of the Dynamic manager
+    for window in (60, 600, 3600, 86400):
+        engine = InferenceEngine(IngestDynamic(observations, window), CaliData)
+        best, mean, result = measure(lambda: InferAll(engine), Repeat)
+        record("infer-window", {"window":window}, best / tags, mean / tags)
+
+    # Against the number of positions inferred
+    engine = InferenceEngine(IngestDynamic(observations), CaliData)
+    allpositions = sorted(room_positions.keys())
+    for count in sorted(set([1, 5, 10, len(allpositions)])):
+        positions = allpositions[:count]
+        best, mean, result = measure(lambda: InferAll(engine, positions), Repeat)
+        record("infer-positions", {"positions":count}, best / tags, mean / tags)
+
+    ## Receiver data buffer parsing, 1000 buffers per run
+    ##-------------------------------------------------------------------------
+    tagids = [binascii.unhexlify(tag) for tag in known_tags.values()]
+    for count in (1, 10, 100):
+        buf = "".join(READING.pack(0x43, 0, tagids[i % len(tagids)]) for i in range(count))
+        best, mean, result = measure(lambda: [ParseTagIds(buf) for i in xrange(1000)], Repeat)
+        record("parse-tag-ids", {"readings":count}, best, mean, count * 1000)
+
+    ## Write the results
+    ##-------------------------------------------------------------------------
+    if OutputFile:
+        output = open(OutputFile, "w")
+        try:
+            json.dump({"time":time.time(), "python":platform.python_version(),
+                       "platform":platform.platform(), "repeat":Repeat,
+                       "results":results}, output, indent=2, sort_keys=True)
+        finally:
+            output.close()
+        print "INFO: Wrote results to %s" % OutputFile
+
+    ## Compare against a previous run
+    ##-------------------------------------------------------------------------
+    if CompareFile:
+        previous = open(CompareFile, "r")
+        try:
+            baseline = json.load(previous)["results"]
+        finally:
+            previous.close()
+
+        key = lambda result: (result["benchmark"], json.dumps(result["params"], sort_keys=True))
+        baseline = dict((key(result), result["best"]) for result in baseline)
+
+        slower = 0
+        for result in results:
+            before = baseline.get(key(result))
+            if not before:
+                continue
+            change = result["best"] / before - 1.0
+            if change > Tolerance:
+                slower += 1
+                print "SLOWER: %s %s %+.1f%%" % (key(result) + (change*100,))
+
+        print "INFO: %d of %d benchmarks slower than the baseline" % (slower, len(results))
+        if slower > 0:
+            sys.exit(1)
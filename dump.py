@@ -15,11 +15,48 @@
         --receiver-samples    The number of samples between power level
                               changes for the receiver.
                               Default: 100 samples
+        
+        --gain-schedule       Share the samples of each receiver sweep
+                              between the gain levels in proportion to
+                              how informative the calibration data in this
+                              calibration file shows they are.
+                              Default: None (sample every gain evenly)
+        
+        --gain-explore        The fraction of samples still spread evenly
+                              over every gain level when --gain-schedule
+                              is used.
+                              Default: 0.1
+        
+        --metrics             Record performance metrics and publish them
+                              with the given sink, one of log[:SECONDS],
+                              file:FILE[:SECONDS] or http[:PORT].
+                              Default: None (metrics are not recorded)
+        
+        --aggregate           Count the samples of each receiver at the
+                              receiver's connection and queue one count
+                              delta per gain level (block), or one every
+                              SECONDS seconds and at the end of each gain
+                              level, rather than every sample.
+                              Default: None (queue every sample)
+        
+        --queue-size          The maximum number of observations waiting
+                              in each queue of the pipeline.
+                              Default: 10000
+        
+        --queue-policy        What happens when an observation is put into
+                              a full queue, one of block (wait for room),
+                              drop-oldest or coalesce (combine it with the
+                              newest waiting observation if it is of the
+                              same receiver and gain level, or else drop
+                              the oldest).  See Positioning.BoundedQueue.
+                              Default: block
 """
-from Positioning.DataSource.ReceiverServer import ReceiverServer
+from Positioning.DataSource.ReceiverServer import ReceiverServer, GainScheduler
+from Positioning.DataSource.CalibrationFile import ParseCalibrationFile
 from Positioning.DataSource.DumpFile import DumpFileWriter
+from Positioning.BoundedQueue import BoundedQueue, BLOCK, POLICIES
+from Positioning import Metrics, Identifiers
 
-from Queue import Queue
 from getopt import getopt
 
 import sys, threading
@@ -33,13 +70,19 @@ if __name__ == '__main__':
         print "Usage: %s " % (sys.argv[0])
         print "\t<--observation-dump-file=FILE> [--max-observations=INT]"
         print "\t[--receiver-rate=FLOAT] [--receiver-samples=INT]"
+        print "\t[--gain-schedule=FILE] [--gain-explore=FLOAT]"
+        print "\t[--metrics=log[:SECONDS]|file:FILE[:SECONDS]|http[:PORT]]"
+        print "\t[--aggregate=block|SECONDS]"
+        print "\t[--queue-size=INT] [--queue-policy=block|drop-oldest|coalesce]"
         sys.exit(1)    
     
     ## Start by parsing the command line arguments
     ##-------------------------------------------------------------------------
     options = [
         "observation-dump-file=","max-observations=",
-        "receiver-rate=","receiver-samples="
+        "receiver-rate=","receiver-samples=",
+        "gain-schedule=","gain-explore=","metrics=","queue-size=","queue-policy=",
+        "aggregate="
         ]
     
     optlist, args = getopt(sys.argv[1:], '', options)
@@ -51,14 +94,44 @@ if __name__ == '__main__':
     ReceiverRate = float(optlist.get("--receiver-rate", 1))
     ReceiverSamples = int(optlist.get("--receiver-samples", 100))
     
+    GainSchedule = optlist.get("--gain-schedule")
+    GainExplore = float(optlist.get("--gain-explore", 0.1))
+    
+    MetricsSink = optlist.get("--metrics")
+    
+    Aggregate = optlist.get("--aggregate")
+    if Aggregate == "block":
+        Aggregate = 0.0
+    elif Aggregate is not None:
+        Aggregate = float(Aggregate)
+    
+    QueueSize = int(optlist.get("--queue-size", 10000))
+    QueuePolicy = optlist.get("--queue-policy", BLOCK)
+    if QueueSize < 1:
+        usage("The queue size must be at least one.")
+    if QueuePolicy not in POLICIES:
+        usage("Unknown queue policy: %s" % QueuePolicy)
+    
     if not DumpFile:
         usage("No observation dump file specified.")
     
+    if MetricsSink:
+        Metrics.StartSink(MetricsSink)
+    
+    # The observations are only in flight until they are written, let the
+    # ids of tags which are no longer seen be reused
+    Identifiers.tags.reuse(600)
+    
     ## Start up receivers 
     ##-------------------------------------------------------------------------    
-    ObservationQueue = Queue()
+    ObservationQueue = BoundedQueue(QueueSize, QueuePolicy, name="observations")
+    
+    scheduler = None
+    if GainSchedule:
+        scheduler = GainScheduler(ParseCalibrationFile(GainSchedule), n=ReceiverSamples, explore=GainExplore)
     
-    rserver = ReceiverServer(queue=ObservationQueue, t=ReceiverRate, n=ReceiverSamples)
+    rserver = ReceiverServer(queue=ObservationQueue, t=ReceiverRate, n=ReceiverSamples, scheduler=scheduler,
+                             aggregate=Aggregate)
     rserver.start()
     
     class EchoWriter(threading.Thread):
@@ -87,8 +160,10 @@ if __name__ == '__main__':
                 try:
                     obs = self.queue.get(True,1.0)
                     
-                    self.count += 1
-                    if self.count % 100 == 0:
+                    # A coalesced observation stands for a number of them
+                    previous = self.count
+                    self.count += obs.samples
+                    if self.count // 100 > previous // 100:
                         print "Wrote %d observations to file" % self.count
                     
                     self.file.writeObservation(obs)
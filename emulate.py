@@ -0,0 +1,155 @@
+"""
+    This script emulates any number of GAO RFID Receivers, each connecting to
+    a receiver server (such as the one started by dump.py or infer.py) and
+    answering its requests with tag readings sampled from calibration data.
+    It allows the network ingest path to be tested without any hardware.
+
+    Each emulated receiver takes its probabilities of detection from one of
+    the receivers of the calibration file, in turn.  Note that the server
+    records observations by the address the receiver connects from, so
+    unless the emulated addresses are the ones in Thesis.constants the
+    observations are only useful for load testing, not for inference.
+
+    Command Line Options:
+        --calibration-file    The calibration file to sample detections
+                              from.
+
+        --placement-file      A placement file giving the position of every
+                              emulated tag, see the
+                              Positioning.DataSource.PlacementFile module.
+                              Default: Every known tag at a random position
+
+        --receivers           The number of receivers to emulate.
+                              Default: 4
+
+        --server              The HOST:PORT address of the receiver server.
+                              Default: 127.0.0.1:8900
+
+        --bind-loopback       Connect every receiver from a different
+                              loopback address (127.0.0.2, 127.0.0.3 and so
+                              on) so the server sees distinct receivers.
+
+        --latency             The number of seconds every reply is delayed.
+                              Default: 0
+
+        --jitter              The maximum number of seconds added to the
+                              latency at random.
+                              Default: 0
+
+        --drop-rate           The probability of a request never being
+                              answered, the receiver then drops the
+                              connection and reconnects.
+                              Default: 0
+
+        --seed                The seed of the random number generators.
+                              Default: None
+"""
+from Positioning.DataSource.CalibrationFile import ParseCalibrationFile
+from Positioning.DataSource.PlacementFile import ParsePlacementFile
+from Protocol.GAOEmulator import EmulatedReceiver, DetectionTable
+from Thesis.constants import known_tags
+from getopt import getopt
+
+import sys, time, random, threading
+
+if __name__ == '__main__':
+    ## A function to print usage
+    ##-------------------------------------------------------------------------
+    def usage(error):
+        print "Error: %s\n" % error
+        print "Usage: %s " % (sys.argv[0])
+        print "\t<--calibration-file=FILE> [--placement-file=FILE]"
+        print "\t[--receivers=INT] [--server=HOST:PORT] [--bind-loopback]"
+        print "\t[--latency=FLOAT] [--jitter=FLOAT] [--drop-rate=FLOAT] [--seed=INT]"
+        sys.exit(1)
+
+    ## Start by parsing the command line arguments
+    ##-------------------------------------------------------------------------
+    options = [
+        "calibration-file=","placement-file=","receivers=","server=",
+        "bind-loopback","latency=","jitter=","drop-rate=","seed="
+        ]
+
+    optlist, args = getopt(sys.argv[1:], '', options)
+    optlist = dict(optlist)
+
+    CalibrationFile = optlist.get("--calibration-file")
+    PlacementFile   = optlist.get("--placement-file")
+    Receivers       = int(optlist.get("--receivers", 4))
+    BindLoopback    = optlist.has_key("--bind-loopback")
+    Latency         = float(optlist.get("--latency", 0))
+    Jitter          = float(optlist.get("--jitter", 0))
+    DropRate        = float(optlist.get("--drop-rate", 0))
+    Seed            = optlist.get("--seed")
+
+    host, port = (optlist.get("--server", "127.0.0.1:8900").split(":") + ["8900"])[:2]
+    Server = (host, int(port))
+
+    if Seed is not None:
+        Seed = int(Seed)
+
+    if not CalibrationFile:
+        usage("No calibration file specified.")
+    if Receivers < 1:
+        usage("At least one receiver must be emulated.")
+
+    ## Work out which tags are where and the detection table of every
+    ## receiver in the calibration data
+    ##-------------------------------------------------------------------------
+    CalibrationData = ParseCalibrationFile(CalibrationFile)
+    recvs = sorted(set(recv for recv,gain,pos in CalibrationData.keys()))
+
+    if PlacementFile:
+        placement = ParsePlacementFile(PlacementFile)
+    else:
+        rand = random.Random(Seed)
+        positions = sorted(set(pos for recv,gain,pos in CalibrationData.keys()))
+        placement = dict((tag,rand.choice(positions)) for tag in known_tags.values())
+
+    tables = dict((recv,DetectionTable(CalibrationData, recv, placement)) for recv in recvs)
+
+    ## Start the receivers
+    ##-------------------------------------------------------------------------
+    emulated = []
+    for i in range(Receivers):
+        bind = None
+        if BindLoopback:
+            bind = "127.0.%d.%d" % (i / 250, i % 250 + 2)
+
+        seed = None
+        if Seed is not None:
+            seed = Seed + i
+
+        receiver = EmulatedReceiver(tables[recvs[i % len(recvs)]], server=Server, bind=bind,
+                                    latency=Latency, jitter=Jitter, droprate=DropRate, seed=seed)
+        receiver.start()
+        emulated.append(receiver)
+
+    print "INFO: Emulating %d receivers connecting to %s:%d" % (Receivers, Server[0], Server[1])
+
+    ## Report the request rate until the user stops the emulator
+    ##-------------------------------------------------------------------------
+    class Reporter(threading.Thread):
+        def __init__(self, interval=10.0):
+            self.interval = interval
+            threading.Thread.__init__(self)
+            self.setDaemon(True)
+
+        def run(self):
+            last = 0
+            while True:
+                time.sleep(self.interval)
+                requests = sum(r.requests for r in emulated)
+                print "INFO: %d requests (%.1f/s), %d dropped, %d connections" % (
+                        requests, (requests - last) / self.interval,
+                        sum(r.drops for r in emulated), sum(r.connections for r in emulated))
+                last = requests
+
+    Reporter().start()
+
+    print "PRESS <ENTER> TO SHUTDOWN THE PROGRAM"
+    sys.stdin.readline()
+    for receiver in emulated:
+        receiver.stop()
+
+    sys.exit(0)
@@ -0,0 +1,369 @@
+"""
+    This script measures how the accuracy of the positioning system trades
+    against its cost.  An observation dump is replayed through an
+    observation manager and the InferenceEngine once for every combination
+    of the swept settings, and the error of the inferred position of every
+    tag is compared with the CPU time and number of observations used.
+    The combinations are evaluated in parallel, one process each.
+
+    The swept settings are:
+        window                The window size of a Dynamic manager, or the
+                              Static manager (none).
+
+        samples               The number of samples kept from each gain
+                              level of a receiver's sweep, the rest are
+                              skipped as if the receivers took fewer.  The
+                              dump must not hold aggregated counts.
+
+        gains                 The gain levels whose observations are kept.
+
+        receivers             The receivers whose observations are kept.
+
+    The tags are inferred every --eval-interval seconds of observation time
+    and at the end of the dump.  At every evaluation the distance between
+    each tag's continuous estimate (see the centroid() function of the
+    InferenceEngine module) and its true position at that time is recorded,
+    along with whether its most likely position is the true one.  Dumps
+    written by generate.py, in either format, can be evaluated against the
+    placement file it writes.
+
+    Command Line Options:
+        --observation-file    The observation file to replay, a comma
+                              separated or binary observation dump file.
+
+        --calibration-file    The calibration file to infer with.
+
+        --placement-file      The placement file giving the true position of
+                              every tag, with the time of every move if the
+                              tags moved, see the
+                              Positioning.DataSource.PlacementFile module.
+
+        --window              A comma separated list of window sizes in
+                              seconds, "none" for the Static manager.
+                              Default: none
+
+        --samples             A comma separated list of the number of
+                              samples kept per gain level, "all" for
+                              every sample.
+                              Default: all
+
+        --gains               A semicolon separated list of gain level
+                              subsets, each a comma separated list of gain
+                              levels or ranges such as 0-15, or "all".
+                              Default: all
+
+        --receivers           A semicolon separated list of receiver
+                              subsets, each a comma separated list of
+                              receiver addresses, or "all".
+                              Default: all
+
+        --eval-interval       The number of seconds of observation time
+                              between evaluations.
+                              Default: None (only at the end of the dump)
+
+        --processes           The number of processes to evaluate with.
+                              Default: The number of CPUs
+
+        --output              Write the results to this file as CSV.
+                              Default: None
+
+        --target              The largest acceptable mean error.  The
+                              combination using the least CPU time within
+                              it is reported.
+                              Default: None
+"""
+from Positioning.DataSource.CalibrationFile import ParseCalibrationFile
+from Positioning.DataSource.PlacementFile import ParsePlacementHistory, PlacementAt
+from Positioning.DataSource.DumpFile import DumpFileReader
+from Positioning.DataSource.BinaryDumpFile import BinaryDumpFileReader, IsBinaryDumpFile
+from Positioning.ObservationManager import Dynamic, Static
+from Positioning.InferenceEngine import InferenceEngine, centroid
+from Positioning import Identifiers
+from Thesis.constants import room_positions
+from multiprocessing import Pool, cpu_count
+from itertools import product
+from getopt import getopt
+from math import sqrt
+
+import sys, os, time
+
+class ListQueue(object):
+    """
+        A queue which collects every observation offered to it.
+    """
+    def __init__(self):
+        self.items = []
+
+    def put(self,item):
+        self.items.append(item)
+
+# The data every evaluation shares, loaded once by each process
+Observations = None
+CaliData = None
+Placement = None
+
+def Load(observationfile,calibrationfile,placementfile):
+    """
+        Loads the observations, calibration data and placement of the tags
+        into the globals of the process.
+    """
+    global Observations, CaliData, Placement
+    queue = ListQueue()
+    if IsBinaryDumpFile(observationfile):
+        BinaryDumpFileReader(queue, observationfile).run()
+    else:
+        DumpFileReader(queue, observationfile).run()
+    Observations = queue.items
+    CaliData = ParseCalibrationFile(calibrationfile)
+    Placement = ParsePlacementHistory(placementfile)
+
+def CPUTime():
+    """
+        Returns the CPU time used by the process and every thread of it.
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+def ParseGains(spec):
+    """
+        Parses a comma separated list of gain levels and ranges of gain
+        levels (such as 0-15) into a sorted tuple.
+    """
+    gains = set()
+    for part in spec.split(","):
+        if "-" in part:
+            low,high = [int(x) for x in part.split("-")]
+            gains.update(range(low, high + 1))
+        else:
+            gains.add(int(part))
+    return tuple(sorted(gains))
+
+def ParseSubsets(spec,parse):
+    """
+        Parses a semicolon separated list of subsets, each parsed by the
+        function 'parse' or None for "all".
+    """
+    return [None if subset == "all" else parse(subset) for subset in spec.split(";")]
+
+def Subsample(observations,samples,gains,receivers):
+    """
+        Yields the observations of the receivers in 'receivers' at the gain
+        levels in 'gains' (None for all of either), keeping only the first
+        'samples' samples of each gain level of a receiver's sweep.
+
+        A CountDelta record can not be split, so when 'samples' is given
+        every observation must be a single sample.
+    """
+    if gains is not None:
+        gains = set(gains)
+    if receivers is not None:
+        receivers = set(Identifiers.receivers.intern(recv) for recv in receivers)
+
+    # The gain level and samples so far of the sweep of every receiver,
+    # counted before filtering so a sweep ends whenever the gain changes
+    runs = dict()
+    for obs in observations:
+        count = 0
+        if samples is not None:
+            if obs.samples > 1:
+                raise Exception("Only single observations can be subsampled, not counts of %d" % obs.samples)
+            gain,count = runs.get(obs.recv, (None,0))
+            if gain != obs.gain:
+                count = 0
+            runs[obs.recv] = (obs.gain, count + 1)
+
+        if gains is not None and obs.gain not in gains:
+            continue
+        if receivers is not None and obs.recv not in receivers:
+            continue
+        if samples is not None and count >= samples:
+            continue
+
+        yield obs
+
+def Score(engine,truth):
+    """
+        Infers every tag of the dictionary 'truth', mapping tag IDs to their
+        true positions, and returns a list of tuples of the error of each
+        estimate and whether the most likely position was the true one.
+    """
+    scores = []
+    for tag,pos in truth.items():
+        likelihood = engine.infer(tag)
+        x,y = centroid(likelihood)
+        tx,ty = room_positions[pos]
+        best = max(likelihood, key=likelihood.get)
+        scores.append( (sqrt((x-tx)**2 + (y-ty)**2), best == pos) )
+    return scores
+
+def Evaluate(config):
+    """
+        Replays the observations with the settings of 'config', a tuple of
+        the window, samples, gains, receivers and evaluation interval, and
+        returns a dictionary of the settings and results.
+    """
+    window,samples,gains,receivers,interval = config
+    observations = list(Subsample(Observations, samples, gains, receivers))
+
+    # Every tag of the placement file is tracked, not just the known tags
+    tags = Placement.keys()
+
+    start = CPUTime()
+    if window is None:
+        manager = Static.ObservationsManager(TagList=tags)
+        manager.setDaemon(True)
+        manager.start()
+    else:
+        manager = Dynamic.ObservationsManager(window,TagList=tags)
+    engine = InferenceEngine(manager, CaliData)
+
+    # The static manager applies observations on its own thread so every
+    # one put must be applied before inferring
+    consumed = [0]
+    def wait():
+        if window is None:
+            while manager.observationCount < consumed[0]:
+                time.sleep(0.001)
+        else:
+            manager.prune()
+
+    scores = []
+    evaluation = None
+    if interval is not None and observations:
+        evaluation = observations[0].time + interval
+
+    for obs in observations:
+        while evaluation is not None and obs.time >= evaluation:
+            wait()
+            scores.extend(Score(engine, PlacementAt(Placement, evaluation)))
+            evaluation += interval
+
+        manager.put(obs)
+        if obs.recv in manager.recvlist:
+            consumed[0] += obs.samples
+
+    wait()
+    if observations:
+        scores.extend(Score(engine, PlacementAt(Placement, observations[-1].time)))
+    cpu = CPUTime() - start
+
+    if window is None:
+        manager.stop()
+
+    errors = sorted(error for error,hit in scores)
+    return {"window":window, "samples":samples, "gains":gains, "receivers":receivers,
+            "observations":consumed[0], "cpu":cpu, "evaluations":len(scores),
+            "mean":sum(errors) / len(errors) if errors else float("nan"),
+            "median":errors[len(errors) // 2] if errors else float("nan"),
+            "hits":float(sum(1 for error,hit in scores if hit)) / len(scores) if scores else 0.0}
+
+def Describe(value,default="all"):
+    """
+        Returns a short description of a swept setting for the report, the
+        default is used for None.
+    """
+    if value is None:
+        return default
+    if isinstance(value, tuple):
+        return ",".join(str(x) for x in value)
+    return str(value)
+
+if __name__ == '__main__':
+    ## A function to print usage
+    ##-------------------------------------------------------------------------
+    def usage(error):
+        print "Error: %s\n" % error
+        print "Usage: %s " % (sys.argv[0])
+        print "\t<--observation-file=FILE> <--calibration-file=FILE> <--placement-file=FILE>"
+        print "\t[--window=none|FLOAT[,...]] [--samples=all|INT[,...]]"
+        print "\t[--gains=all|GAINS[;...]] [--receivers=all|ADDRESSES[;...]]"
+        print "\t[--eval-interval=FLOAT] [--processes=INT] [--output=FILE] [--target=FLOAT]"
+        sys.exit(1)
+
+    ## Start by parsing the command line arguments
+    ##-------------------------------------------------------------------------
+    options = [
+        "observation-file=","calibration-file=","placement-file=","window=",
+        "samples=","gains=","receivers=","eval-interval=","processes=",
+        "output=","target="
+        ]
+
+    optlist, args = getopt(sys.argv[1:], '', options)
+    optlist = dict(optlist)
+
+    ObservationFile = optlist.get("--observation-file")
+    CalibrationFile = optlist.get("--calibration-file")
+    PlacementFile   = optlist.get("--placement-file")
+
+    Windows   = [None if x == "none" else float(x) for x in optlist.get("--window", "none").split(",")]
+    Samples   = [None if x == "all" else int(x) for x in optlist.get("--samples", "all").split(",")]
+    Gains     = ParseSubsets(optlist.get("--gains", "all"), ParseGains)
+    Receivers = ParseSubsets(optlist.get("--receivers", "all"), lambda x: tuple(x.split(",")))
+
+    Interval = optlist.get("--eval-interval")
+    if Interval is not None:
+        Interval = float(Interval)
+
+    Processes = int(optlist.get("--processes", cpu_count()))
+    OutputFile = optlist.get("--output")
+
+    Target = optlist.get("--target")
+    if Target is not None:
+        Target = float(Target)
+
+    if not ObservationFile:
+        usage("No observation file specified.")
+    if not CalibrationFile:
+        usage("No calibration file specified.")
+    if not PlacementFile:
+        usage("No placement file specified.")
+    if Interval is not None and Interval <= 0:
+        usage("The evaluation interval must be positive.")
+
+    ## Evaluate every combination of the swept settings
+    ##-------------------------------------------------------------------------
+    configs = [config + (Interval,) for config in product(Windows, Samples, Gains, Receivers)]
+    print "INFO: Evaluating %d combinations with %d processes" % (len(configs), Processes)
+
+    pool = Pool(Processes, Load, (ObservationFile, CalibrationFile, PlacementFile))
+    results = []
+    for result in pool.imap_unordered(Evaluate, configs):
+        results.append(result)
+        print "INFO: %d of %d done" % (len(results), len(configs))
+    pool.close()
+    pool.join()
+
+    ## Report the results, most accurate first
+    ##-------------------------------------------------------------------------
+    columns = ("window","samples","gains","receivers","observations","cpu","mean","median","hits")
+    results.sort(key=lambda result: (result["mean"], result["cpu"]))
+
+    print "%-8s %-7s %-16s %-16s %12s %8s %8s %8s %6s" % columns
+    for result in results:
+        print "%-8s %-7s %-16s %-16s %12d %8.3f %8.3f %8.3f %6.2f" % (
+                Describe(result["window"],"none"), Describe(result["samples"]),
+                Describe(result["gains"])[:16], Describe(result["receivers"])[:16],
+                result["observations"], result["cpu"], result["mean"],
+                result["median"], result["hits"])
+
+    if OutputFile:
+        output = open(OutputFile, "w")
+        try:
+            output.write(",".join(columns) + "\n")
+            for result in results:
+                values = [Describe(result[column]) for column in columns]
+                values[0] = Describe(result["window"],"none")
+                output.write(",".join('"%s"' % value if "," in value else value for value in values) + "\n")
+        finally:
+            output.close()
+        print "INFO: Wrote results to %s" % OutputFile
+
+    if Target is not None:
+        within = [result for result in results if result["mean"] <= Target]
+        if within:
+            best = min(within, key=lambda result: result["cpu"])
+            print "INFO: Cheapest within %.3f: window=%s samples=%s gains=%s receivers=%s (%.3fs, mean error %.3f)" % (
+                    Target, Describe(best["window"],"none"), Describe(best["samples"]), Describe(best["gains"]),
+                    Describe(best["receivers"]), best["cpu"], best["mean"])
+        else:
+            print "INFO: No combination has a mean error within %.3f" % Target
@@ -0,0 +1,311 @@
+"""
+    This script generates synthetic observation dump files from calibration
+    data, for benchmarking the parsers, observation managers and inference
+    without waiting for real captures.  Unlike the Simulator class it does
+    not run in real time and can place any number of tags, so dumps of any
+    size can be written as fast as the disk allows.
+
+    Every receiver of the calibration file sweeps the gain levels as a
+    ReceiverConnection would, taking --receiver-samples samples per gain
+    level every --receiver-rate seconds, and detects each tag at random
+    with the probability the calibration data gives for the tag's position.
+    The samples are drawn in parallel, each process drawing the detections
+    of a share of the tags.
+
+    The tags are the known tags of the Thesis.constants module followed by
+    generated tag IDs, and they move with one of the movement models:
+        static                Every tag stays at a random position.
+
+        jump                  Every tag moves to a random position every
+                              --mobility seconds.
+
+        walk                  Every tag moves to a random position no more
+                              than --step away every --mobility seconds.
+
+    The true position of every tag is written to a placement file with the
+    time of every move, see the Positioning.DataSource.PlacementFile module.
+
+    Command Line Options:
+        --calibration-file    The calibration file to sample detections
+                              from.
+
+        --output              The observation dump file to write.
+
+        --truth-file          The placement file to record the true
+                              positions of the tags in.
+                              Default: The output file with .place appended
+
+        --format              The format of the dump, csv (see the
+                              Positioning.DataSource.DumpFile module) or
+                              binary (see the BinaryDumpFile module).
+                              Default: csv
+
+        --tags                The number of tags.
+                              Default: The number of known tags
+
+        --movement            The movement model, static, jump or walk.
+                              Default: static
+
+        --mobility            The number of seconds between moves.
+                              Default: 300 seconds
+
+        --step                The furthest a tag walks in one move.
+                              Default: 4.0
+
+        --duration            The number of seconds of observations.
+                              Default: 3600 seconds
+
+        --start               The time of the first observation.
+                              Default: 0
+
+        --receiver-rate       The number of seconds between each receiver
+                              sampling.
+                              Default: 1 second
+
+        --receiver-samples    The number of samples between power level
+                              changes for the receiver.
+                              Default: 100 samples
+
+        --processes           The number of processes drawing samples.
+                              Default: The number of CPUs
+
+        --seed                The seed of the random number generators.
+                              Default: 0
+"""
+from Positioning.DataSource.CalibrationFile import ParseCalibrationFile
+from Positioning.DataSource.BinaryDumpFile import MAGIC, PackObservation
+from Positioning.SpatialIndex import room_index
+from Thesis.constants import known_tags, room_positions
+from multiprocessing import Pool, cpu_count
+from timeit import default_timer
+from getopt import getopt
+
+import sys, os, time, random, binascii
+
+# The number of sampling slots of every receiver drawn by a single task
+BLOCK = 600
+
+# The settings every process shares, set up by the Setup function
+Table = None
+Receivers = None
+TagIds = None
+Trajectories = None
+Settings = None
+
+def Setup(table,receivers,tagids,trajectories,settings):
+    """
+        Sets the globals of a process drawing samples.
+    """
+    global Table, Receivers, TagIds, Trajectories, Settings
+    Table, Receivers, TagIds, Trajectories, Settings = table, receivers, tagids, trajectories, settings
+
+def TagIdentifiers(count,binary):
+    """
+        Returns the IDs of 'count' tags, the known tags first, as strings of
+        12 hexadecimal digits or as raw 6 byte strings if binary is set.
+    """
+    tags = sorted(known_tags.values())[:count]
+    tags += ["%012x" % (0xA00000000000 + i) for i in range(count - len(tags))]
+    if binary:
+        tags = [binascii.unhexlify(tag) for tag in tags]
+    return tags
+
+def Trajectory(rand,positions,movement,start,end,mobility,step):
+    """
+        Returns the list of (time, position) moves of a tag from the time
+        'start' to 'end' following the movement model 'movement'.
+    """
+    moves = [(start, rand.choice(positions))]
+    if movement == "static":
+        return moves
+
+    allowed = set(positions)
+    ctime = start + mobility
+    while ctime < end:
+        current = moves[-1][1]
+        if movement == "jump":
+            choices = positions
+        else:
+            x,y = room_positions[current]
+            choices = sorted(pos for pos in room_index.radius(x, y, step) if pos in allowed and pos != current)
+        if choices:
+            moves.append( (ctime, rand.choice(choices)) )
+        ctime += mobility
+    return moves
+
+def Sample(task):
+    """
+        Draws the detections of the tags numbered 'first' to 'last' during
+        the sampling slots of the block of a task, a tuple of the block and
+        the (first, last) tags.  Returns the list of the detected tags of
+        every observation of the block in order, joined for the format.
+    """
+    block,(first,last) = task
+    start, rate, samples, slots, seed, binary = Settings
+    rand = random.Random("%s-%d-%d" % (seed, block, first))
+    separator = "" if binary else ";"
+
+    # The index of each tag's current move and the time of its next move
+    tags = range(first, last)
+    moves = dict((tag,0) for tag in tags)
+
+    count = len(Receivers)
+    lines = []
+    for slot in xrange(block * BLOCK, min((block + 1) * BLOCK, slots)):
+        gain = (slot // samples) % 32
+        for i,recv in enumerate(Receivers):
+            ctime = start + slot * rate + i * rate / count
+            probs = Table[(recv,gain)]
+
+            detected = []
+            for tag in tags:
+                trajectory = Trajectories[tag]
+                j = moves[tag]
+                while j + 1 < len(trajectory) and trajectory[j+1][0] <= ctime:
+                    j += 1
+                moves[tag] = j
+
+                p = probs.get(trajectory[j][1], 0.0)
+                if p > 0 and rand.random() < p:
+                    detected.append(TagIds[tag])
+            lines.append(separator.join(detected))
+
+    return lines
+
+if __name__ == '__main__':
+    ## A function to print usage
+    ##-------------------------------------------------------------------------
+    def usage(error):
+        print "Error: %s\n" % error
+        print "Usage: %s " % (sys.argv[0])
+        print "\t<--calibration-file=FILE> <--output=FILE> [--truth-file=FILE]"
+        print "\t[--format=csv|binary] [--tags=INT] [--movement=static|jump|walk]"
+        print "\t[--mobility=FLOAT] [--step=FLOAT] [--duration=FLOAT] [--start=FLOAT]"
+        print "\t[--receiver-rate=FLOAT] [--receiver-samples=INT]"
+        print "\t[--processes=INT] [--seed=INT]"
+        sys.exit(1)
+
+    ## Start by parsing the command line arguments
+    ##-------------------------------------------------------------------------
+    options = [
+        "calibration-file=","output=","truth-file=","format=","tags=",
+        "movement=","mobility=","step=","duration=","start=",
+        "receiver-rate=","receiver-samples=","processes=","seed="
+        ]
+
+    optlist, args = getopt(sys.argv[1:], '', options)
+    optlist = dict(optlist)
+
+    CalibrationFile = optlist.get("--calibration-file")
+    OutputFile      = optlist.get("--output")
+    TruthFile       = optlist.get("--truth-file", "%s.place" % OutputFile)
+    Format          = optlist.get("--format", "csv")
+    Tags            = int(optlist.get("--tags", len(known_tags)))
+    Movement        = optlist.get("--movement", "static")
+    Mobility        = float(optlist.get("--mobility", 300))
+    Step            = float(optlist.get("--step", 4.0))
+    Duration        = float(optlist.get("--duration", 3600))
+    Start           = float(optlist.get("--start", 0))
+    ReceiverRate    = float(optlist.get("--receiver-rate", 1))
+    ReceiverSamples = int(optlist.get("--receiver-samples", 100))
+    Processes       = int(optlist.get("--processes", cpu_count()))
+    Seed            = int(optlist.get("--seed", 0))
+
+    if not CalibrationFile:
+        usage("No calibration file specified.")
+    if not OutputFile:
+        usage("No output file specified.")
+    if Format not in ("csv","binary"):
+        usage("Unknown format: %s" % Format)
+    if Movement not in ("static","jump","walk"):
+        usage("Unknown movement model: %s" % Movement)
+    if Tags < 1:
+        usage("At least one tag must be generated.")
+    if Mobility <= 0 or ReceiverRate <= 0 or ReceiverSamples < 1:
+        usage("The mobility, receiver rate and receiver samples must be positive.")
+
+    Binary = Format == "binary"
+
+    ## Work out the detection table of every receiver and gain level, and
+    ## where every tag is at every time
+    ##-------------------------------------------------------------------------
+    CaliData = ParseCalibrationFile(CalibrationFile)
+    receivers = sorted(set(recv for recv,gain,pos in CaliData.keys()))
+    positions = sorted(set(pos for recv,gain,pos in CaliData.keys()))
+
+    table = dict(((recv,gain),dict()) for recv in receivers for gain in range(32))
+    for (recv,gain,pos),p in CaliData.items():
+        table[(recv,gain)][pos] = p
+
+    tagids = TagIdentifiers(Tags, Binary)
+    rand = random.Random(Seed)
+    trajectories = [Trajectory(rand, positions, Movement, Start, Start + Duration, Mobility, Step)
+                        for tag in range(Tags)]
+
+    names = TagIdentifiers(Tags, False)
+    truth = open(TruthFile, "w")
+    try:
+        truth.write("# Generated from %s, %d tags moving by %s\n" % (CalibrationFile, Tags, Movement))
+        for tag,moves in zip(names, trajectories):
+            for ctime,pos in moves:
+                truth.write("%s,%d,%f\n" % (tag, pos, ctime))
+    finally:
+        truth.close()
+
+    ## Draw the samples a few blocks at a time, each block split between
+    ## the processes by tag, and write them in order
+    ##-------------------------------------------------------------------------
+    slots = int(Duration / ReceiverRate)
+    blocks = (slots + BLOCK - 1) // BLOCK
+    share = (Tags + Processes - 1) // Processes
+    chunks = [(first, min(first + share, Tags)) for first in range(0, Tags, share)]
+
+    settings = (Start, ReceiverRate, ReceiverSamples, slots, Seed, Binary)
+    pool = Pool(Processes, Setup, (table, receivers, tagids, trajectories, settings))
+
+    output = open(OutputFile, "wb")
+    started = default_timer()
+    written = 0
+    try:
+        if Binary:
+            output.write(MAGIC)
+        else:
+            output.write("# Generated from %s, %d tags moving by %s\n" % (CalibrationFile, Tags, Movement))
+
+        count = len(receivers)
+        group = max(1, Processes)
+        for first in range(0, blocks, group):
+            tasks = [(block,chunk) for block in range(first, min(first + group, blocks)) for chunk in chunks]
+            results = pool.map(Sample, tasks, 1)
+
+            for i in range(0, len(results), len(chunks)):
+                block = tasks[i][0]
+                parts = results[i:i+len(chunks)]
+
+                lines = []
+                for j in xrange(len(parts[0])):
+                    slot = block * BLOCK + j // count
+                    recv = receivers[j % count]
+                    gain = (slot // ReceiverSamples) % 32
+                    ctime = Start + slot * ReceiverRate + (j % count) * ReceiverRate / count
+
+                    if Binary:
+                        lines.append(PackObservation(ctime, recv, gain, "".join(part[j] for part in parts)))
+                    else:
+                        detected = ";".join(part[j] for part in parts if part[j])
+                        lines.append("%f,%s,%d,%s\n" % (ctime, recv, gain, detected))
+
+                output.write("".join(lines))
+                written += len(lines)
+
+            print "INFO: Wrote %d observations (%.1f MB)" % (written, output.tell() / 1048576.0)
+    finally:
+        output.close()
+        pool.close()
+        pool.join()
+
+    elapsed = default_timer() - started
+    size = os.path.getsize(OutputFile)
+    print "INFO: Wrote %d observations of %d tags to %s in %.1fs (%.1f MB/s)" % (
+            written, Tags, OutputFile, elapsed, size / 1048576.0 / max(elapsed, 1e-9))
+    print "INFO: Wrote the true positions to %s" % TruthFile
@@ -36,12 +36,48 @@
                               changes for the receiver.
                               Default: 100 samples
         
+        --gain-schedule       Share the samples of each receiver sweep
+                              between the gain levels in proportion to
+                              how informative the calibration data in this
+                              calibration file shows they are.  Leave the
+                              file empty (--gain-schedule=) to use the
+                              --calibration-file.
+                              Default: None (sample every gain evenly)
+        
+        --gain-explore        The fraction of samples still spread evenly
+                              over every gain level when --gain-schedule
+                              is used.
+                              Default: 0.1
+        
+        --gain-threshold      Skip receiver gain levels whose probability
+                              of detection varies by no more than this
+                              across all positions when inferring.  Zero
+                              only skips gain levels which can not change
+                              the result.
+                              Default: 0.0
+        
         --window-size         Specifying a window size causes the script
                               to use a sliding window of observations
                               to infer the tag's location.  Observations
                               not in the range of [now - value, now] are
                               not included in the inference.
                               Default: None
+        
+        --discover            Add receivers and tags not listed in
+                              Thesis.constants as they are first seen,
+                              the --tag-id option then also accepts any
+                              tag ID.
+        
+        --expire              When discovering, forget tags which have not
+                              been detected for this many seconds.
+                              Default: None (never forget tags)
+        
+        --max-records         With a window size, the number of tag
+                              detection entries kept before the tags
+                              detected least recently are forgotten.
+                              Detections of a tag at the same receiver,
+                              gain level and time share one entry.
+                              Default: None (no limit)
                               
         --vis-step            The number of observations between
                               visualization updates.
@@ -51,26 +87,87 @@
                               
         --vis-filled          When drawing the visualization use a colour
                               gradient rather than the contour lines.
+                              
+        --vis-headless        Do not open a window for the visualization,
+                              use with --vis-dump to only write png files.
+                              
+        --likelihood-file     Record every inferred likelihood to this
+                              likelihood record file, the frames can be
+                              rendered later with the render.py script.
+                              Combine with --vis-headless to skip drawing
+                              entirely.
         
         --obs-dump-file       Write every incoming observation to this 
                               output observation dump file as well as
                               to the visualization.
+        
+        --track               Filter the inferred likelihoods over time
+                              with a hidden markov model and report the
+                              tracked position rather than the most likely
+                              position of each inference.
+        
+        --track-sigma         The expected distance the tag moves between
+                              two visualization updates when tracking.
+                              Default: 2.0
+        
+        --metrics             Record performance metrics (queue depths,
+                              ingest rates, inference latency and receiver
+                              round trip times) and publish them with the
+                              given sink, one of log[:SECONDS],
+                              file:FILE[:SECONDS] or http[:PORT].  See the
+                              Positioning.Metrics module.
+                              Default: None (metrics are not recorded)
+        
+        --aggregate           Count the samples of each receiver at the
+                              receiver's connection and queue one count
+                              delta per gain level (block), or one every
+                              SECONDS seconds and at the end of each gain
+                              level, rather than every sample.
+                              Default: None (queue every sample)
+        
+        --queue-size          The maximum number of observations waiting
+                              in each queue of the pipeline.
+                              Default: 10000
+        
+        --queue-policy        What happens when an observation is put into
+                              a full queue, one of block (wait for room),
+                              drop-oldest or coalesce (combine it with the
+                              newest waiting observation if it is of the
+                              same receiver and gain level, or else drop
+                              the oldest).  See Positioning.BoundedQueue.
+                              Default: block
+        
+        --checkpoint-file     Periodically write the state of the
+                              observation manager to this file.  If the
+                              file exists at startup the state is restored
+                              from it, and only the observations after it
+                              are replayed from the --observation-file or
+                              --obs-dump-file.
+                              Default: None
+        
+        --checkpoint-interval The number of seconds between checkpoints.
+                              Default: 60 seconds
 """
-from Positioning.DataSource.ReceiverServer import ReceiverServer
+from Positioning.DataSource.ReceiverServer import ReceiverServer, GainScheduler
+from Positioning.DataSource.CalibrationFile import ParseCalibrationFile
 from Positioning.DataSource.DumpFile import DumpFileReader, DumpFileWriter
 from Positioning.DataSource.Simulator import Simulator
+from Positioning.DataSource.LikelihoodFile import LikelihoodFileWriter
+from Positioning.BoundedQueue import BoundedQueue, BLOCK, POLICIES
+from Positioning import Metrics, Identifiers
 
 from Thesis.constants import *
 from getopt import getopt
-from Queue import Queue
 
 from Positioning.ObservationManager import Dynamic, Static
-from Positioning.InferenceEngine import InferenceEngine
+from Positioning.ObservationManager.Checkpoint import Checkpointer
+from Positioning.InferenceEngine import InferenceEngine, centroid
+from Positioning.Tracker import Tracker
 
 from Visualization.room import *
 from itertools import izip
 
-import sys, time, pylab
+import sys, os, time, pylab
 
 if __name__ == '__main__':
 
@@ -82,9 +179,16 @@ if __name__ == '__main__':
         print "\t<--tag-id=ID> <--calibration-file=FILE>"
         print "\t[--observation-file=FILE | --simulate=POSLIST]"
         print "\t[--receiver-rate=FLOAT] [--receiver-samples=INT]"
+        print "\t[--gain-schedule=[FILE]] [--gain-explore=FLOAT] [--gain-threshold=FLOAT]"
         print "\t[--simulate-mobility=INT] [--window-size=FLOAT]"
-        print "\t[--vis-step=INT] [--vis-dump] [--vis-filled]"
-        print "\t[--obs-dump-file=FILE]"
+        print "\t[--discover] [--expire=FLOAT] [--max-records=INT]"
+        print "\t[--vis-step=INT] [--vis-dump] [--vis-filled] [--vis-headless]"
+        print "\t[--likelihood-file=FILE]"
+        print "\t[--obs-dump-file=FILE] [--track] [--track-sigma=FLOAT]"
+        print "\t[--metrics=log[:SECONDS]|file:FILE[:SECONDS]|http[:PORT]]"
+        print "\t[--aggregate=block|SECONDS]"
+        print "\t[--queue-size=INT] [--queue-policy=block|drop-oldest|coalesce]"
+        print "\t[--checkpoint-file=FILE] [--checkpoint-interval=FLOAT]"
         sys.exit(1)
     
     ## Start by parsing the command line arguments
@@ -92,8 +196,11 @@ if __name__ == '__main__':
     options = [
         "window-size=","calibration-file=","observation-file=",
         "simulate=","simulate-mobility=","tag-id=","vis-step=",
-        "vis-dump","vis-filled","receiver-rate=","receiver-samples=",
-        "obs-dump-file="
+        "vis-dump","vis-filled","vis-headless","receiver-rate=","receiver-samples=",
+        "obs-dump-file=","track","track-sigma=","likelihood-file=",
+        "gain-schedule=","gain-explore=","gain-threshold=","metrics=",
+        "discover","expire=","max-records=","checkpoint-file=","checkpoint-interval=",
+        "queue-size=","queue-policy=","aggregate="
         ]
     
     optlist, args = getopt(sys.argv[1:], '', options)
@@ -101,11 +208,20 @@ if __name__ == '__main__':
     
     WindowSize = float(optlist.get("--window-size","-1"))
     
+    Discover = optlist.has_key("--discover")
+    Expire = optlist.get("--expire")
+    if Expire is not None:
+        Expire = float(Expire)
+    MaxRecords = optlist.get("--max-records")
+    if MaxRecords is not None:
+        MaxRecords = int(MaxRecords)
+    
     ShowConverge = optlist.has_key("--show-converge")
     
     VisualizationRate = int(optlist.get("--vis-step","1000"))
     VisualizationDump = optlist.has_key("--vis-dump")
     VisualizationFill = optlist.has_key("--vis-filled")
+    VisualizationHeadless = optlist.has_key("--vis-headless")
     
     CalibrationFile = optlist.get("--calibration-file")
     ObservationFile = optlist.get("--observation-file")
@@ -116,15 +232,48 @@ if __name__ == '__main__':
     SimulateMobility = int(optlist.get("--simulate-mobility","500"))
     
     DumpObservationsFile = optlist.get("--obs-dump-file")
+    LikelihoodFile = optlist.get("--likelihood-file")
     
     ReceiverRate = float(optlist.get("--receiver-rate", 1))
     ReceiverSamples = int(optlist.get("--receiver-samples", 100))
     
+    GainSchedule = optlist.get("--gain-schedule")
+    GainExplore = float(optlist.get("--gain-explore", 0.1))
+    GainThreshold = float(optlist.get("--gain-threshold", 0.0))
+    
+    TrackPosition = optlist.has_key("--track")
+    TrackSigma = float(optlist.get("--track-sigma", 2.0))
+    
+    MetricsSink = optlist.get("--metrics")
+    
+    Aggregate = optlist.get("--aggregate")
+    if Aggregate == "block":
+        Aggregate = 0.0
+    elif Aggregate is not None:
+        Aggregate = float(Aggregate)
+    
+    QueueSize = int(optlist.get("--queue-size", 10000))
+    QueuePolicy = optlist.get("--queue-policy", BLOCK)
+    if QueueSize < 1:
+        usage("The queue size must be at least one.")
+    if QueuePolicy not in POLICIES:
+        usage("Unknown queue policy: %s" % QueuePolicy)
+    
+    CheckpointFile = optlist.get("--checkpoint-file")
+    CheckpointInterval = float(optlist.get("--checkpoint-interval", 60))
+    
     TagID = known_tags.get(optlist.get("--tag-id"))
+    if TagID is None and Discover:
+        TagID = optlist.get("--tag-id")
     if TagID is None:
         usage("No Tag ID Specified")
     if CalibrationFile is None:
         usage("No Calibration File Specified") 
+    
+    ## Start publishing metrics before anything is recorded
+    ##-------------------------------------------------------------------------
+    if MetricsSink:
+        Metrics.StartSink(MetricsSink)
         
     ## Open the calibration data file and parse the data
     ##-------------------------------------------------------------------------
@@ -142,15 +291,37 @@ if __name__ == '__main__':
     ## Create an ObservationsManager for the Data Source to write to
     ##-------------------------------------------------------------------------
     if WindowSize > 0:
-        obsman = Dynamic.ObservationsManager(WindowSize)
+        obsman = Dynamic.ObservationsManager(WindowSize,discover=Discover,expire=Expire,
+                                             maxrecords=MaxRecords)
     else:
-        obsman = Static.ObservationsManager()
+        obsman = Static.ObservationsManager(discover=Discover,expire=Expire,
+                                            queuesize=QueueSize,policy=QueuePolicy)
+    
+    # Tags the manager does not hold are only briefly in flight, let their
+    # ids be reused so running for a long time does not grow every bitmask
+    Identifiers.tags.reuse(600)
+    
+    # Restore the state of the last run, if it left a checkpoint
+    Restored = None
+    if CheckpointFile and os.path.exists(CheckpointFile):
+        obsman.loadState(CheckpointFile)
+        Restored = obsman.mostrecent
+        print "INFO: Restored %d observations up to %f from %s" % (obsman.observationCount, Restored, CheckpointFile)
+    
     obsman.start()
     
+    # Replay the observations dumped after the checkpoint, before any new
+    # ones are appended to the dump
+    if Restored is not None and not ObservationFile and DumpObservationsFile and os.path.exists(DumpObservationsFile):
+        DumpFileReader(queue=obsman,filename=DumpObservationsFile,after=Restored).run()
+    
+    if CheckpointFile:
+        Checkpointer(obsman,CheckpointFile,interval=CheckpointInterval).start()
+    
     ## Define the observations queue based on whether or not dumping was set
     ##-------------------------------------------------------------------------
     if DumpObservationsFile:
-        DumpQueue = Queue()
+        DumpQueue = BoundedQueue(QueueSize, QueuePolicy, name="dump")
         ObservationsQueue = (obsman, DumpQueue)
         
         DumpWriter = DumpFileWriter(filename=DumpObservationsFile, queue=DumpQueue)
@@ -162,16 +333,34 @@ if __name__ == '__main__':
     ## Instantiate the Data Source
     ##-------------------------------------------------------------------------
     if ObservationFile:
-        DataSource = DumpFileReader(queue=ObservationsQueue,filename=ObservationFile)
+        DataSource = DumpFileReader(queue=ObservationsQueue,filename=ObservationFile,after=Restored)
     elif SimulatePositions:
         DataSource = Simulator(queue=ObservationsQueue, cali=CalibrationData, tag=TagID,
                                     movement=SimulatePositions, mobility=SimulateMobility)
     else: 
-        DataSource = ReceiverServer(queue=ObservationsQueue,t=ReceiverRate,n=ReceiverSamples)
+        scheduler = None
+        if GainSchedule:
+            scheduler = GainScheduler(ParseCalibrationFile(GainSchedule),n=ReceiverSamples,explore=GainExplore)
+        elif GainSchedule is not None:
+            scheduler = GainScheduler(CalibrationData,n=ReceiverSamples,explore=GainExplore)
+        DataSource = ReceiverServer(queue=ObservationsQueue,t=ReceiverRate,n=ReceiverSamples,
+                                        scheduler=scheduler,aggregate=Aggregate)
     
     ## Create an InferenceEngine
     ##-------------------------------------------------------------------------
-    iengine = InferenceEngine(obsman,CalibrationData)
+    iengine = InferenceEngine(obsman,CalibrationData,threshold=GainThreshold)
+    
+    ## Create a Tracker to filter the inferred likelihoods if requested
+    ##-------------------------------------------------------------------------
+    tracker = None
+    if TrackPosition:
+        tracker = Tracker(sigma=TrackSigma)
+    
+    ## Open the likelihood record file if requested
+    ##-------------------------------------------------------------------------
+    LikelihoodWriter = None
+    if LikelihoodFile:
+        LikelihoodWriter = LikelihoodFileWriter(LikelihoodFile, room_positions.keys())
     
     ## Draw the visualization and wait the refresh rate time before drawing again
     ##-------------------------------------------------------------------------        
@@ -180,7 +369,11 @@ if __name__ == '__main__':
             self.visnum = 0
             self.tag = tag
             self.obsman = obsman
-            self.geodata = GeometryPoints(0.25)
+            self.renderer = None
+            
+            # Only draw if there is somewhere for the drawing to go
+            if VisualizationDump or not VisualizationHeadless:
+                self.renderer = RoomRenderer(filled=VisualizationFill,headless=VisualizationHeadless)
             
         def notify(self,subject):
             argmax = lambda array: max(izip(array, xrange(len(array))))[1]
@@ -188,12 +381,24 @@ if __name__ == '__main__':
             values = iengine.infer(self.tag)
             ipos = argmax(values.values())
             
-            plotTitle = "%d Observations [Maximal Likelihood=%s]" % (self.obsman.observationCount,ipos)
+            if tracker is not None:
+                tracker.update(values)
+                ipos = tracker.position()
+            
+            ix,iy = centroid(values)
+            
+            plotTitle = "%d Observations [Maximal Likelihood=%s, Estimate=(%.2f, %.2f)]" % (self.obsman.observationCount,ipos,ix,iy)
+            
+            if LikelihoodWriter is not None:
+                LikelihoodWriter.writeRecord(time.time(),self.obsman.observationCount,values,
+                                                position=ipos,estimate=(ix,iy))
+                LikelihoodWriter.flush()
             
-	    RoomContour(values,self.geodata,figure_number=1,title=plotTitle,legend=False,xlabel="",ylabel="",filled=VisualizationFill)
+            if self.renderer is not None:
+                self.renderer.draw(values,title=plotTitle,estimate=(ix,iy))
             
             if VisualizationDump:
-                pylab.savefig("%06d.png" % self.visnum)
+                self.renderer.save("%06d.png" % self.visnum)
             
             self.visnum = self.visnum + 1
 
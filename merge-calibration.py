@@ -0,0 +1,48 @@
+"""
+    This script merges calibration files from several (possibly partial)
+    calibration sessions into a single calibration file.  The counts of
+    every receiver, power level and position are summed, so the merged
+    file has exactly one line for each of them.
+
+    Command Line Options:
+        --output              The calibration file to write the merged
+                              data to.  It must not be one of the inputs.
+
+    Every other argument is the name of a calibration file to merge.
+"""
+from Positioning.DataSource.CalibrationFile import CalibrationFileWriter, MergeCalibrationFiles
+from getopt import getopt
+
+import sys, os
+
+if __name__ == '__main__':
+    ## A function to print usage
+    ##-------------------------------------------------------------------------
+    def usage(error):
+        print "Error: %s\n" % error
+        print "Usage: %s " % (sys.argv[0])
+        print "\t<--output=FILE> <FILE> [FILE ...]"
+        sys.exit(1)
+
+    ## Start by parsing the command line arguments
+    ##-------------------------------------------------------------------------
+    optlist, args = getopt(sys.argv[1:], '', ["output="])
+    optlist = dict(optlist)
+
+    OutputFile = optlist.get("--output")
+
+    if not OutputFile:
+        usage("No output file specified.")
+    if len(args) == 0:
+        usage("No calibration files to merge.")
+    if os.path.abspath(OutputFile) in [os.path.abspath(x) for x in args]:
+        usage("The output file can not be one of the merged files.")
+
+    ## Merge the files
+    ##-------------------------------------------------------------------------
+    writer = CalibrationFileWriter(OutputFile)
+    try:
+        writer.writeComment("Merged from: %s" % ", ".join(args))
+        MergeCalibrationFiles(args, writer)
+    finally:
+        writer.close()
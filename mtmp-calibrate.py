@@ -0,0 +1,174 @@
+"""
+    The purpose of this script is to measure the probability of detecting
+    MULTIPLE TAGS at MULTIPLE POSITIONS (MTMP) at the same time.  Every tag
+    seen in a receiver's response is counted, so a single calibration pass
+    writes calibration data for every tag listed in the placement file.
+
+    Each tag's data is written to its own calibration file named
+    Tag<ALIAS>.cali, where the alias is taken from Thesis.constants (the
+    tag's ID is used if it has no alias).  Placing a single tag gives the
+    same result as stsp-calibrate.py and placing several tags at the same
+    position is the MTSP case.
+
+    Command Line Options:
+        --placement-file      A placement file listing the position of
+                              every tag being calibrated, see the
+                              Positioning.DataSource.PlacementFile module.
+
+        --receiver-rate       Sets the number of seconds between each
+                              receiver sampling.
+                              Default: 1 second
+
+        --receiver-samples    The number of samples between power level
+                              changes for the receiver.  When --ci-width
+                              is given this is the maximum number.
+                              Default: 100 samples
+
+        --ci-width            Sample each power level only until the 95%
+                              confidence interval of the probability of
+                              detection of every placed tag is narrower
+                              than this value.  The number of samples used
+                              is recorded in the calibration files.
+                              Default: None (always take every sample)
+
+        --min-samples         The minimum number of samples to take at
+                              each power level when --ci-width is given.
+                              Default: 10 samples
+
+    Every power level is written to the calibration files as soon as it has
+    been measured.  If the script is restarted, tags which already have
+    enough samples for a power level at their position are not written
+    again, and power levels complete for every tag are skipped entirely.
+"""
+from Positioning.DataSource.CalibrationFile import CalibrationFileWriter, CompletedCells
+from Positioning.DataSource.PlacementFile import ParsePlacementFile
+from Protocol.GAORfidReceiver import Server
+from Thesis.constants import known_hosts, known_tags
+from tests import AdvStatsTest, AdaptiveStatsTest
+from getopt import getopt
+
+import sys, threading
+
+# Use this lock to make sure that only one thread attempts to access the files
+# at the same time.
+FileLock = threading.RLock()
+
+class CalibrationThread(threading.Thread):
+    def __init__(self, placement, writers, connection, rate, count, width=None, minimum=10, completed=None):
+        self.placement = placement
+        self.rate = rate
+        self.count = count
+        self.width = width
+        self.minimum = minimum
+        if completed is None:
+            completed = dict()
+        self.completed = completed
+
+        self.writers = writers
+        self.connection = connection
+
+        threading.Thread.__init__(self)
+
+    def run(self):
+        recv = self.connection.addr
+
+        ## Go through all power levels, counting the detections of every placed
+        ## tag at each power level.  When a confidence interval width is given
+        ## use the adaptive test, which may take fewer samples.
+        for gain in range(32):
+            ids = [id for id,pos in self.placement.items()
+                        if (recv,gain,pos) not in self.completed.get(id,())]
+            if len(ids) == 0:
+                print "INFO: Receiver %s already has gain=%d calibration set." % (recv,gain)
+                continue
+
+            print "INFO: Receiver %s is running gain=%d calibration set." % (recv,gain)
+            if self.width is None:
+                n = self.count
+                x = AdvStatsTest(g=gain,n=self.count,t=self.rate,con=self.connection,ids=ids)
+            else:
+                n,x = AdaptiveStatsTest(t=self.rate,g=gain,con=self.connection,ids=ids,
+                                        width=self.width,nmin=self.minimum,nmax=self.count)
+
+            ## Write the power level to the calibration files straight away so
+            ## that it is not lost if the connection drops.
+            FileLock.acquire(True)
+            try:
+                for id in ids:
+                    self.writers[id].writeCalibrationData(receiver=recv, rate=self.rate, gain=gain,
+                                                            position=self.placement[id],
+                                                            samples=n, detections=x[id])
+                    self.writers[id].flush()
+            finally:
+                FileLock.release()
+
+        ## Notify the user that the calibration process has completed.
+        print "INFO: Receiver %s has finished calibration." % recv
+        sys.stdout.write("\a")
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    ## A function to print usage
+    ##-------------------------------------------------------------------------
+    def usage(error):
+        print "Error: %s\n" % error
+        print "Usage: %s " % (sys.argv[0])
+        print "\t<--placement-file=FILE>"
+        print "\t[--receiver-rate=FLOAT] [--receiver-samples=INT]"
+        print "\t[--ci-width=FLOAT] [--min-samples=INT]"
+        sys.exit(1)
+
+    ## Start by parsing the command line arguments
+    ##-------------------------------------------------------------------------
+    options = [
+        "placement-file=","receiver-rate=","receiver-samples=",
+        "ci-width=","min-samples="
+        ]
+
+    optlist, args = getopt(sys.argv[1:], '', options)
+    optlist = dict(optlist)
+
+    PlacementFile = optlist.get("--placement-file")
+
+    rate  = float(optlist.get("--receiver-rate", 1))
+    count = int(optlist.get("--receiver-samples", 100))
+
+    width = optlist.get("--ci-width")
+    if width is not None:
+        width = float(width)
+    minimum = int(optlist.get("--min-samples", 10))
+
+    if not PlacementFile:
+        usage("No placement file specified.")
+
+    placement = ParsePlacementFile(PlacementFile)
+    if len(placement) == 0:
+        usage("The placement file does not place any tags.")
+
+    ## Find the power levels already measured by a previous session, then open
+    ## a writer object for every tag, named by the tag's alias
+    ##-------------------------------------------------------------------------
+    aliases = dict((id,alias) for alias,id in known_tags.items())
+
+    writers = dict()
+    completed = dict()
+    for id,pos in placement.items():
+        filename = "Tag%s.cali" % aliases.get(id,id)
+        completed[id] = CompletedCells(filename, count if width is None else minimum)
+        writers[id] = CalibrationFileWriter(filename)
+        writers[id].writeComment("MTMP calibration of tag %s at position %d" % (id,pos))
+        print "INFO: Calibrating tag %s at position %d" % (id,pos)
+
+    print "INFO: Starting Server"
+    serv = Server()
+    serv.connect()
+
+    ## Wait until the maximum number of connections has been reached
+    for i in range( len(known_hosts.keys()) ):
+        con = serv.getNextConnection()
+        print "INFO: Connected by receiver %s on port %d" % (con.addr, con.port)
+
+        thread = CalibrationThread(placement,writers,con,rate,count,width,minimum,completed)
+        thread.start()
+
+    print "INFO: Maximum connections reached."
@@ -0,0 +1,119 @@
+"""
+    This script renders the frames of a likelihood record file, written by
+    the --likelihood-file option of infer.py, to PNG files.  Frames are
+    drawn offscreen with the Agg backend and spread across a pool of
+    processes, so rendering is not limited by the speed of the original run.
+
+    Command Line Options:
+        --likelihood-file     The likelihood record file to render.
+
+        --vis-prefix          When writing to PNG files prepend this
+                              onto the filenames.
+                              Default: None
+
+        --vis-filled          When drawing the visualization use a colour
+                              gradient rather than the contour lines.
+
+        --legend              Add a colour bar to every frame.
+
+        --vis-region          Only draw the positions inside of this
+                              bounding box, given as XMIN,YMIN,XMAX,YMAX
+                              in the coordinates of room_positions.
+                              Default: The whole room
+
+        --processes           The number of processes to render with.
+                              Default: The number of CPUs
+
+        --video               After rendering, join the frames into this
+                              video file using ffmpeg.
+                              Default: None
+
+        --frame-rate          The number of frames per second of the video.
+                              Default: 10
+"""
+import matplotlib
+matplotlib.use("Agg")
+
+from Positioning.DataSource.LikelihoodFile import ParseLikelihoodFile
+from Visualization.room import RoomRenderer
+
+from multiprocessing import Pool, cpu_count
+from getopt import getopt
+
+import sys, subprocess
+
+# Every process in the pool keeps its own renderer so the walls and the
+# interpolation basis are only built once per process
+renderer = None
+
+def initialize(filled, legend, region=None):
+    global renderer
+    renderer = RoomRenderer(filled=filled, legend=legend, headless=True, region=region)
+
+def render(job):
+    filename, record = job
+    t,n,pos,estimate,likelihood = record
+
+    title = "%d Observations [Maximal Likelihood=%s, Estimate=(%.2f, %.2f)]" % (n,pos,estimate[0],estimate[1])
+    renderer.draw(likelihood, title=title, estimate=estimate)
+    renderer.save(filename)
+    return filename
+
+if __name__ == '__main__':
+    ## A function to print usage
+    ##-------------------------------------------------------------------------
+    def usage(error):
+        print "Error: %s\n" % error
+        print "Usage: %s " % (sys.argv[0])
+        print "\t<--likelihood-file=FILE> [--vis-prefix=STRING] [--vis-filled]"
+        print "\t[--legend] [--processes=INT] [--video=FILE] [--frame-rate=INT]"
+        print "\t[--vis-region=XMIN,YMIN,XMAX,YMAX]"
+        sys.exit(1)
+
+    ## Start by parsing the command line arguments
+    ##-------------------------------------------------------------------------
+    options = [
+        "likelihood-file=","vis-prefix=","vis-filled","legend","vis-region=",
+        "processes=","video=","frame-rate="
+        ]
+
+    optlist, args = getopt(sys.argv[1:], '', options)
+    optlist = dict(optlist)
+
+    LikelihoodFile = optlist.get("--likelihood-file")
+    VisPrefix      = optlist.get("--vis-prefix","")
+    FilledContour  = optlist.has_key("--vis-filled")
+    UseLegend      = optlist.has_key("--legend")
+    Processes      = int(optlist.get("--processes", cpu_count()))
+    VideoFile      = optlist.get("--video")
+    FrameRate      = int(optlist.get("--frame-rate", 10))
+    Region         = optlist.get("--vis-region")
+
+    if Region is not None:
+        Region = tuple(float(x) for x in Region.split(","))
+        if len(Region) != 4:
+            usage("The region must be given as XMIN,YMIN,XMAX,YMAX.")
+
+    if not LikelihoodFile:
+        usage("No likelihood record file specified.")
+
+    ## Render every record in parallel
+    ##-------------------------------------------------------------------------
+    records = ParseLikelihoodFile(LikelihoodFile)
+    jobs = [("%s%06d.png" % (VisPrefix,i), record) for i,record in enumerate(records)]
+
+    print "INFO: Rendering %d frames with %d processes" % (len(jobs), Processes)
+
+    pool = Pool(Processes, initialize, (FilledContour, UseLegend, Region))
+    for done, filename in enumerate(pool.imap(render, jobs, chunksize=16)):
+        if (done + 1) % 100 == 0:
+            print "INFO: Rendered %d frames" % (done + 1)
+    pool.close()
+    pool.join()
+
+    ## Join the frames into a video if requested
+    ##-------------------------------------------------------------------------
+    if VideoFile:
+        subprocess.check_call(["ffmpeg", "-y", "-framerate", str(FrameRate),
+                               "-i", "%s%%06d.png" % VisPrefix,
+                               "-pix_fmt", "yuv420p", VideoFile])
@@ -8,18 +8,36 @@
                               Default: 1 second
                               
         --receiver-samples    The number of samples between power level
-                              changes for the receiver.
+                              changes for the receiver.  When --ci-width
+                              is given this is the maximum number.
                               Default: 100 samples
+        
+        --ci-width            Sample each power level only until the 95%
+                              confidence interval of the probability of
+                              detection is narrower than this value.  The
+                              number of samples used is recorded in the
+                              calibration file.
+                              Default: None (always take every sample)
+        
+        --min-samples         The minimum number of samples to take at
+                              each power level when --ci-width is given.
+                              Default: 10 samples
+
+    Every power level is written to the calibration file as soon as it has
+    been measured.  If the script is restarted, power levels which already
+    have enough samples in the calibration file for this position are
+    skipped, so an interrupted session only measures what is missing.
 """
 #Authors Note:  To improve the efficiency of the calibration period
 # it should be possible to develop a MTSP AND MTMP calibration script
 # MTSP: Multiple Tag Single Position
 # MTMP: Multiple Tag Multiple Position)
+# Both are now handled by the mtmp-calibrate.py script.
 
-from Positioning.DataSource.CalibrationFile import CalibrationFileWriter
+from Positioning.DataSource.CalibrationFile import CalibrationFileWriter, CompletedCells
 from Protocol.GAORfidReceiver import Server
 from Thesis.constants import known_hosts, known_tags
-from tests import SimpleStatsTest
+from tests import SimpleStatsTest, AdaptiveStatsTest
 from getopt import getopt
 
 import sys, threading
@@ -29,11 +47,16 @@ import sys, threading
 FileLock = threading.RLock()
 
 class CalibrationThread(threading.Thread):
-    def __init__(self, ID, pos, writer, connection, rate, count):
+    def __init__(self, ID, pos, writer, connection, rate, count, width=None, minimum=10, completed=None):
         self.id = ID
         self.pos = pos        
         self.rate = rate
         self.count = count
+        self.width = width
+        self.minimum = minimum
+        if completed is None:
+            completed = set()
+        self.completed = completed
         
         self.writer = writer
         self.connection = connection
@@ -44,27 +67,37 @@ class CalibrationThread(threading.Thread):
         recv = self.connection.addr
         
         ## Go through all power levels, running the simple statistics test to get
-        ## a detection count at each power level.
-        results = []
+        ## a detection count at each power level.  When a confidence interval
+        ## width is given use the adaptive test, which may take fewer samples.
         for gain in range(32):
+            if (recv,gain,self.pos) in self.completed:
+                print "INFO: Receiver %s already has gain=%d calibration set." % (recv,gain)
+                continue
+            
             print "INFO: Receiver %s is running gain=%d calibration set." % (recv,gain)
-            x = SimpleStatsTest(n=self.count,t=self.rate,g=gain,id=self.id,con=self.connection)
-            results.append(x)
+            if self.width is None:
+                n = self.count
+                x = SimpleStatsTest(n=self.count,t=self.rate,g=gain,id=self.id,con=self.connection)
+            else:
+                n,x = AdaptiveStatsTest(t=self.rate,g=gain,con=self.connection,ids=[self.id],
+                                        width=self.width,nmin=self.minimum,nmax=self.count)
+                x = x[self.id]
+            
+            ## Write the power level to the calibration file straight away so
+            ## that it is not lost if the connection drops.
+            FileLock.acquire(True)
+            try:
+                self.writer.writeCalibrationData(receiver=recv, rate=self.rate, gain=gain, position=self.pos, 
+                                                        samples=n, detections=x)
+                self.writer.flush()
+            finally:
+                FileLock.release()
         
         ## Notify the user that the calibration process for this position has
-        ## completed, then write all the data to the calibration file.
+        ## completed.
         print "INFO: Receiver %s has finished calibration." % recv
         sys.stdout.write("\a")
         sys.stdout.flush()
-        
-        FileLock.acquire(True)
-        try:
-            for g in range(32):
-                self.writer.writeCalibrationData(receiver=recv, rate=self.rate, gain=g, position=self.pos, 
-                                                        samples=self.count, detections=results[g])
-            self.writer.flush()
-        finally:
-            FileLock.release()
 
 if __name__ == '__main__':    
     ## A function to print usage
@@ -74,12 +107,14 @@ if __name__ == '__main__':
         print "Usage: %s " % (sys.argv[0])
         print "\t<--tag-id=ALIAS|ID> <--position=INT>"
         print "\t[--receiver-rate=FLOAT] [--receiver-samples=INT]"
+        print "\t[--ci-width=FLOAT] [--min-samples=INT]"
         sys.exit(1)
         
     ## Start by parsing the command line arguments
     ##-------------------------------------------------------------------------
     options = [
-        "tag-id=","position=","--receiver-rate=","--receiver-samples="
+        "tag-id=","position=","receiver-rate=","receiver-samples=",
+        "ci-width=","min-samples="
         ]
     
     optlist, args = getopt(sys.argv[1:], '', options)
@@ -90,15 +125,24 @@ if __name__ == '__main__':
     
     rate  = float(optlist.get("--receiver-rate", 1))
     count = int(optlist.get("--receiver-samples", 100))
+    
+    width = optlist.get("--ci-width")
+    if width is not None:
+        width = float(width)
+    minimum = int(optlist.get("--min-samples", 10))
         
     if not id:
         usage("No tag specified.")
     if pos < 0:
         usage("Position not specified or is invalid")
         
-    ## Open a writer object for this tag, retrieve the actual id for the alias
+    ## Find the power levels already measured by a previous session, then open
+    ## a writer object for this tag and retrieve the actual id for the alias
     ##-------------------------------------------------------------------------
-    writer = CalibrationFileWriter("Tag%s.cali" % id)
+    filename = "Tag%s.cali" % id
+    
+    completed = CompletedCells(filename, count if width is None else minimum)
+    writer = CalibrationFileWriter(filename)
     
     if id in known_tags.keys():
         id = known_tags.get(id)
@@ -112,7 +156,7 @@ if __name__ == '__main__':
         con = serv.getNextConnection()
         print "INFO: Connected by receiver %s on port %d" % (con.addr, con.port)
         
-        thread = CalibrationThread(id,pos,writer,con,rate,count)
+        thread = CalibrationThread(id,pos,writer,con,rate,count,width,minimum,completed)
         thread.start()
         
     print "INFO: Maximum connections reached."
@@ -1,24 +1,52 @@
 """
     This module defines a set of functions which will take a receiver
     connection and perform a statistical test with it.
+
+    Every test counts a tag at most once per sample, however many times it
+    appears in the receiver's response, so the number of detections never
+    exceeds the number of samples.
 """
+from math import sqrt
 import time
 
-def AdvStatsTest(g,n,t,con):
+def ConfidenceWidth(x,n,z=1.96):
+    """
+        Returns the width of the Wilson score confidence interval of the
+        probability of detection after 'x' detections in 'n' samples.  The
+        default z value gives a 95% interval.  Unlike the normal
+        approximation the interval is still meaningful when x is 0 or n,
+        which is common for very low and very high gain levels.
+    """
+    if n == 0:
+        return 1.0
+    p = float(x) / n
+    z2 = z * z
+    return 2.0 * z * sqrt(p*(1.0-p)/n + z2/(4.0*n*n)) / (1.0 + z2/n)
+
+def AdvStatsTest(g,n,t,con,ids=None):
     """
         This test sets the receiver's power level to 'g' and queries the
         receiver 'n' times at a sampling rate of 't' seconds.
         
         The test will return a dictionary whose keys are the IDs of detected
-        tags and the keys being the number of times the tag was detected.
+        tags and the keys being the number of samples in which the tag was
+        detected.
+        
+        If a list of tag IDs is given as 'ids' then only those tags are
+        counted, and every one of them is included in the result even if
+        it was never detected.
     """
     CurrentFrequency = lambda x,y : (x in y and y[x]) or 0
     freq = dict()
     
+    if ids is not None:
+        freq = dict((id,0) for id in ids)
+    
     con.setGain(g)
     for i in range(n):
-        for id in [c['id'] for c in con.getData()]:
-            freq[id] = CurrentFrequency(id,freq) + 1        
+        for id in set([c['id'] for c in con.getData()]):
+            if ids is None or id in freq:
+                freq[id] = CurrentFrequency(id,freq) + 1        
         time.sleep(t)
         
     return freq
@@ -28,15 +56,44 @@ def SimpleStatsTest(n,t,g,id,con):
         This test sets the receiver's power level to 'g' and queries the
         receiver 'n' times at a sampling rate of 't' seconds.
         
-        The test will return the number of times that the tag defined by
-        'id' is detected.
+        The test will return the number of samples in which the tag defined
+        by 'id' is detected.
     """
-    CountDetections = lambda x,y : len([ c['id'] for c in y if c['id'] == x ])
+    Detected = lambda x,y : x in [ c['id'] for c in y ]
     passes = 0
     
     con.setGain(g)
     for i in range(n):
-        passes += CountDetections(id, con.getData())
+        if Detected(id, con.getData()):
+            passes += 1
         time.sleep(t)
         
-    return passes
\ No newline at end of file
+    return passes
+
+def AdaptiveStatsTest(t,g,con,ids,width,nmin=10,nmax=100):
+    """
+        This test sets the receiver's power level to 'g' and queries the
+        receiver at a sampling rate of 't' seconds until the confidence
+        interval of the probability of detecting every tag in 'ids' is
+        narrower than 'width'.  At least 'nmin' and at most 'nmax' samples
+        are taken.
+        
+        The test will return a tuple of the number of samples taken and a
+        dictionary whose keys are the IDs in 'ids' and whose values are the
+        number of samples in which the tag was detected.
+    """
+    freq = dict((id,0) for id in ids)
+    n = 0
+    
+    con.setGain(g)
+    while n < nmax:
+        for id in set([c['id'] for c in con.getData()]):
+            if id in freq:
+                freq[id] += 1
+        n += 1
+        
+        if n >= nmin and max(ConfidenceWidth(x,n) for x in freq.values()) < width:
+            break
+        time.sleep(t)
+    
+    return (n, freq)